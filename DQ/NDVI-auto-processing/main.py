@@ -202,21 +202,11 @@ def add_NDVI(image):
     ndviImg = image.addBands(ndvi).updateMask(ndvi02)
     ndvi02_area = ndvi02.multiply(ee.Image.pixelArea()).rename('ndvi02_area')
 
-    # calculate ndvi > 0.2 area
-    ndviStats = ndvi02_area.reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=geometry_feature,
-        scale=10,
-        maxPixels=1e29
-    )
-
-    image = image.set(ndviStats)
-
     # calculate area of AOI
     area = image.select('B1').multiply(0).add(1).multiply(ee.Image.pixelArea()).rename('area')
 
-    # calculate area
-    img_stats = area.reduceRegion(
+    # calculate ndvi > 0.2 area and area of AOI in one pass, the sum is applied per band with its own mask
+    img_stats = ndvi02_area.addBands(area).reduceRegion(
         reducer=ee.Reducer.sum(),
         geometry=geometry_feature,
         scale=10,
@@ -505,7 +495,6 @@ collection = (ee.ImageCollection('COPERNICUS/S2_HARMONIZED')
 #     ee.Filter.lt('RelCloudArea', 3)
 # )
 ### calculate NDVI
-ndvi_collection = collection.map(add_NDVI)
 ### maps and report
 
 
@@ -522,26 +511,20 @@ new_report = False
 for timeframe in timeframes:
     # get last image date
     timeframe_collection = collection.filterDate(timeframes[timeframe]['start_date'], timeframes[timeframe]['end_date'])
-    ndvi_timeframe_collection = timeframe_collection.map(add_NDVI)
-    ndvi_img_start = ee.Image(ndvi_timeframe_collection.toList(ndvi_timeframe_collection.size()).get(0))
-    ndvi_img_end = ee.Image(ndvi_timeframe_collection.toList(ndvi_timeframe_collection.size()).get(ndvi_timeframe_collection.size().subtract(1)))
-
     # if there is no different image within that timeframe just take the next best
     if timeframe_collection.size().getInfo() > 1:
-        latest_image = ee.Image(timeframe_collection.toList(timeframe_collection.size()).get(timeframe_collection.size().subtract(1)))
-        first_image = ee.Image(timeframe_collection.toList(timeframe_collection.size()).get(0))
-
-        latest_image_date = latest_image.date().format("dd.MM.YYYY").getInfo()
-        first_image_date = first_image.date().format("dd.MM.YYYY").getInfo()
+        latest_image = ee.Image(timeframe_collection.limit(1, 'system:time_start', False).first())
+        first_image = ee.Image(timeframe_collection.limit(1, 'system:time_start').first())
     else:
-        latest_image = ee.Image(collection.toList(collection.size()).get(collection.size().subtract(1)))
-        first_image = ee.Image(collection.toList(collection.size()).get(collection.size().subtract(2)))
+        latest_image = ee.Image(collection.limit(1, 'system:time_start', False).first())
+        first_image = ee.Image(collection.limit(2, 'system:time_start', False).toList(2).get(1))
 
-        latest_image_date = latest_image.date().format("dd.MM.YYYY").getInfo()
-        first_image_date = first_image.date().format("dd.MM.YYYY").getInfo()
+    latest_image_date = latest_image.date().format("dd.MM.YYYY").getInfo()
+    first_image_date = first_image.date().format("dd.MM.YYYY").getInfo()
 
-        ndvi_img_start = ee.Image(add_NDVI(first_image))
-        ndvi_img_end = ee.Image(add_NDVI(latest_image))
+    # only the two endpoint mosaics need NDVI statistics
+    ndvi_img_start = ee.Image(add_NDVI(first_image))
+    ndvi_img_end = ee.Image(add_NDVI(latest_image))
 
     # adjust short-term timeframe text depending on difference of newest data
     if timeframe == 'two_weeks':
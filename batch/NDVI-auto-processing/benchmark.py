@@ -0,0 +1,132 @@
+# !/usr/bin/python3
+# -*- coding: UTF-8 -*-
+# compares server time and request size of pipeline variants on the bundled AOIs
+import json
+import random
+import sys
+import time
+import ee
+from definitions import *
+import lib_ndvi
+from main import init_ee
+from ee_executor import EEExecutor
+from geometry import prepare_geometry
+from scene_catalog import scene_collection
+
+aoi_paths = {
+    'RUH': '../../RUH/NDVI-auto-processing/RUH.geojson',
+    'RUH_CL': '../../RUH_CL/NDVI-auto-processing/RUH_CL.geojson',
+    'KKRS': '../../KKRS/NDVI-auto-processing/KKRS.geojson',
+    'trial3': 'trial3.geojson',
+}
+
+
+def measure(ee_object):
+    # request payload in bytes and wall time of the evaluation
+    payload = len(ee.serializer.toJSON(ee_object).encode('utf-8'))
+    start = time.perf_counter()
+    ee_object.getInfo()
+    return time.perf_counter() - start, payload
+
+
+def print_results(aoi_name, results):
+    for variant, (seconds, payload) in results.items():
+        print(f'{aoi_name:<8} {variant:<12} {seconds:8.2f} s {payload / 1024:10.1f} KB')
+
+
+def bench_mosaic(geo_data):
+    # original graph (clip every scene, all bands) against the optimised mosaic builder
+    geometry_feature = ee.FeatureCollection(geo_data)
+    window_start = get_window_start(lib_ndvi.LatestSceneDate(geometry_feature))
+    results = {}
+    for variant, optimised in (('original', False), ('optimised', True)):
+        mosaic = lib_ndvi.CreateMosaic(window_start, geometry_feature, optimised=optimised)
+        stats = lib_ndvi.add_NDVI(mosaic, geometry_feature).toDictionary(['ndvi02_area', 'area'])
+        results[variant] = measure(stats)
+    return results
+
+
+def bench_geometry(geo_data):
+    # the scene probe (a filterBounds request) with the exact and the simplified geometry
+    simplified_geo_data, area_error = prepare_geometry(geo_data)
+    results = {}
+    for variant, variant_geo_data in (('exact', geo_data), ('simplified', simplified_geo_data)):
+        latest_scene = (ee.ImageCollection(scene_collection)
+            .filterDate(ee.Date(window_origin), ee.Date(py_date))
+            .filterBounds(ee.FeatureCollection(variant_geo_data))
+            .aggregate_max('system:time_start'))
+        results[variant] = measure(latest_scene)
+    print(f'area error of the simplified geometry: {area_error:.4%}')
+    return results
+
+
+def bench_approximate(geo_data):
+    # exact single-request report against the sampled estimate, one year between the endpoints
+    geometry_feature = ee.FeatureCollection(geo_data)
+    end_window = get_window_start(lib_ndvi.LatestSceneDate(geometry_feature))
+    start_window = get_window_start(end_window - timedelta(days=365))
+    collection = ee.ImageCollection([
+        lib_ndvi.CreateMosaic(start_window, geometry_feature),
+        lib_ndvi.CreateMosaic(end_window, geometry_feature),
+    ])
+    timeframe_delta = {
+        'start_date': ee.Date(start_window),
+        'end_date': ee.Date(end_window + timedelta(days=days_in_interval)),
+    }
+
+    results = {}
+    reports = {}
+    for variant, approximate in (('exact', False), ('approximate', True)):
+        start = time.perf_counter()
+        reports[variant] = lib_ndvi.GenerateReport(
+            collection, timeframe_delta, geometry_feature, 'benchmark.png', 'benchmark',
+            single_request=True, approximate=approximate, geo_data=geo_data)['report']
+        results[variant] = (time.perf_counter() - start, 0)
+
+    for key, (low, high) in reports['approximate']['confidence_intervals'].items():
+        exact = reports['exact'][key]
+        estimate = reports['approximate'][key]
+        error = abs(estimate - exact) / abs(exact) if exact else 0
+        covered = 'inside' if low <= exact <= high else 'outside'
+        print(f'{key:<18} exact {exact:14,.0f} estimate {estimate:14,.0f} error {error:7.2%}, exact value {covered} the interval')
+    return results
+
+
+def bench_executor(n_requests=20, latency=0.5):
+    # local stand-in server with injected latency, sequential getInfo calls against the executor
+    def stand_in(ee_object):
+        time.sleep(latency * random.uniform(0.5, 1.5))
+        return ee_object
+
+    start = time.perf_counter()
+    for i in range(n_requests):
+        stand_in(i)
+    results = {'sequential': (time.perf_counter() - start, 0)}
+
+    executor = EEExecutor(max_concurrent_requests=8, requests_per_second=50, burst=8, evaluate=stand_in)
+    start = time.perf_counter()
+    executor.evaluate_many({i: i for i in range(n_requests)})
+    results['executor'] = (time.perf_counter() - start, 0)
+    executor.shutdown()
+    return results
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == 'executor':
+        print_results('stand-in', bench_executor())
+        return
+
+    GEE_CREDENTIALS = sys.argv[1] if len(sys.argv) >= 2 else '../ee-phill-9248b486a4bc.json'
+    service_account = 'ndvi-mailer@ee-phill.iam.gserviceaccount.com'
+    init_ee(service_account, GEE_CREDENTIALS)
+
+    for aoi_name, aoi_path in aoi_paths.items():
+        with open(aoi_path, 'r') as f:
+            geo_data = json.load(f)
+        print_results(aoi_name, bench_mosaic(geo_data))
+        print_results(aoi_name, bench_geometry(geo_data))
+        print_results(aoi_name, bench_approximate(geo_data))
+
+
+if __name__ == "__main__":
+    main()
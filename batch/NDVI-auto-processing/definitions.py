@@ -2,6 +2,7 @@
 # !/usr/bin/python4
 # -*- coding: UTF-8 -*-
 # packages
+import calendar
 import ee
 import folium
 from datetime import datetime, timedelta, timezone
@@ -24,26 +25,73 @@ processing_date = get_str_timestamp()
 # Create list of dates for time series to look for more images around the initial date as the AOI is too large to be covered by one tile.
 days_in_interval = 40
 
+# ndvi value from which a pixel counts as vegetation and the scale of the statistics in m
+ndvi_threshold = 0.2
+stats_scale = 10
+# share of a feature its mosaics have to cover before a batched report warns about partial coverage
+min_mosaic_coverage = 0.99
+
+# bands read by add_NDVI (B1 only feeds the project area band) and the cloud mask band used by maskS2clouds
+mosaic_bands = ['B1', 'B4', 'B8']
+mosaic_qa_band = 'QA60'
+
+# approximate reports: strata_per_side x strata_per_side spatial strata with points_per_stratum sampled pixels each,
+# the stratum areas come from a reduction at the coarser area_scale in m
+approximate_strata_per_side = 4
+approximate_points_per_stratum = 250
+approximate_area_scale = 100
+
+# histogram statistics: NDVI is reduced once into bins of 1/ndvi_histogram_bins weighted by pixel area,
+# so every threshold on a bin edge (0.1, 0.2, ...) is a cumulative sum, report_thresholds are added to each report
+ndvi_histogram_bins = 100
+report_thresholds = [0.1, 0.2, 0.3, 0.4, 0.5]
+
+# geometry for filterBounds and map framing: douglas-peucker tolerance in degrees (about 11 m) and decimals kept (about 0.1 m),
+# the reductions keep the exact geometry
+simplify_tolerance = 0.0001
+coordinate_precision = 6
+
+# fixed at midnight so the windows stay the same between runs and can be indexed
+window_origin = datetime(2016, 7, 1)
+
+def get_window_start(date):
+    # start of the 40-day mosaic window the given date falls into
+    n_windows = (date - window_origin) // timedelta(days=days_in_interval)
+    return window_origin + n_windows * timedelta(days=days_in_interval)
+
+def get_window_starts():
+    # same windows as ee.List.sequence(0, n_months, days_in_interval) advanced from window_origin
+    n_days = round((py_date - window_origin) / timedelta(days=1))
+    return [window_origin + timedelta(days=i) for i in range(0, n_days + 1, days_in_interval)]
+
+def get_millis(date):
+    # milliseconds since epoch the way ee.Date reads a naive datetime (as UTC)
+    return calendar.timegm(date.timetuple()) * 1000 + date.microsecond // 1000
+
+def get_py_timeframes():
+    return {
+        'two_weeks': {'start_date': py_date - timedelta(days=14), 'end_date': py_date},
+        'one_year': {'start_date': py_date - one_year_timedelta, 'end_date': py_date},
+        'since_2016': {'start_date': py_date - five_year_timedelta, 'end_date': py_date},
+        'nov_2016': {
+            'start_date': py_date.replace(year=py_date.year - 5, month=11, day=1) if py_date.replace(month=11, day=1) <= py_date else py_date.replace(year=py_date.year-6, month=11, day=1),
+            'end_date': py_date.replace(month=11, day=1) if py_date.replace(month=11, day=1) <= py_date else py_date.replace(year=py_date.year-1, month=11, day=1),
+        },
+        'july_2016': {
+            'start_date': py_date.replace(year=py_date.year - 5, month=7, day=1) if py_date.replace(month=7, day=1) <= py_date else py_date.replace(year=py_date.year-6, month=7, day=1),
+            'end_date': py_date.replace(month=7, day=1) if py_date.replace(month=7, day=1) <= py_date else py_date.replace(year=py_date.year-1, month=7, day=1),
+        },
+    }
+
 def get_timeframes():
-    start_date = ee.Date(py_date.replace(year=2016, month=7, day=1))
+    start_date = ee.Date(window_origin)
     end_date = ee.Date(py_date)
     n_months = end_date.difference(start_date,'days').round()
 
 
     return  (n_months, {
-        'two_weeks': {'start_date': ee.Date(py_date - timedelta(days=14)), 'end_date': end_date},
-        'one_year': {'start_date': ee.Date(py_date - one_year_timedelta), 'end_date': end_date},
-        'since_2016': {'start_date': ee.Date(py_date - five_year_timedelta), 'end_date': ee.Date(py_date)},
-        'nov_2016': {'start_date': ee.Date(
-            py_date.replace(year=py_date.year - 5, month=11, day=1) if py_date.replace(month=11, day=1) <= py_date else py_date.replace(year=py_date.year-6, month=11, day=1)
-        ), 'end_date': ee.Date(
-            py_date.replace(month=11, day=1) if py_date.replace(month=11, day=1) <= py_date else py_date.replace(year=py_date.year-1, month=11, day=1)
-        )},
-        'july_2016': {'start_date': ee.Date(
-            py_date.replace(year=py_date.year - 5, month=7, day=1) if py_date.replace(month=7, day=1) <= py_date else py_date.replace(year=py_date.year-6, month=7, day=1)
-        ), 'end_date': ee.Date(
-            py_date.replace(month=7, day=1) if py_date.replace(month=7, day=1) <= py_date else py_date.replace(year=py_date.year-1, month=7, day=1)
-        )},
+        timeframe_name: {'start_date': ee.Date(timeframe_delta['start_date']), 'end_date': ee.Date(timeframe_delta['end_date'])}
+        for timeframe_name, timeframe_delta in get_py_timeframes().items()
     })
 
 head_text = {
@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+# persistent cache for earth engine results, keyed by the serialized expression graph
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+import ee
+
+
+def _serialize(ee_object):
+    return ee.serializer.toJSON(ee_object)
+
+
+def _evaluate(ee_objects):
+    # one request for all objects
+    return ee.Dictionary(ee_objects).getInfo()
+
+
+class EECache:
+    # results are only valid as long as the graph pins its inputs, e.g. mosaics built from explicit scene ids
+
+    def __init__(
+        self,
+        path='ee_cache',
+        ttl=365 * 24 * 60 * 60,
+        max_bytes=50 * 1024 * 1024,
+        serialize=_serialize,
+        evaluate=_evaluate
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        # ttl in seconds, None keeps entries until they are evicted for size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.serialize = serialize
+        self.evaluate = evaluate
+        self.hits = 0
+        self.misses = 0
+        # the cache is shared by the features evaluated concurrently
+        self.lock = threading.Lock()
+
+    def key(self, ee_object):
+        return hashlib.sha256(self.serialize(ee_object).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return self.path / key[:2] / f'{key}.json'
+
+    def _load(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        expired = self.ttl is not None and time.time() - entry['created'] > self.ttl
+        try:
+            if expired:
+                os.remove(entry_path)
+            else:
+                # the modification time doubles as last access time for the LRU eviction
+                os.utime(entry_path)
+        except OSError:
+            # removed by another thread in the meantime
+            pass
+        return None if expired else entry
+
+    def _store(self, key, value):
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        with open(entry_path, 'w', encoding='utf-8') as f:
+            json.dump({'created': time.time(), 'value': value}, f)
+
+    def evict(self):
+        # drop least recently used entries until the cache fits into max_bytes
+        entries = []
+        for entry_path in self.path.glob('*/*.json'):
+            try:
+                entries.append((entry_path.stat(), entry_path))
+            except OSError:
+                continue
+        total_bytes = sum(stat.st_size for stat, _ in entries)
+        for stat, entry_path in sorted(entries, key=lambda entry: entry[0].st_mtime):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total_bytes -= stat.st_size
+
+    def get_info(self, ee_object):
+        return self.get_info_many({'value': ee_object})['value']
+
+    def get_info_many(self, ee_objects):
+        # cached values are served locally, all misses are evaluated together in one request
+        keys = {name: self.key(ee_object) for name, ee_object in ee_objects.items()}
+        results = {}
+        missing = {}
+        for name, key in keys.items():
+            entry = self._load(key)
+            if entry is None:
+                missing[name] = ee_objects[name]
+            else:
+                results[name] = entry['value']
+
+        with self.lock:
+            self.hits += len(results)
+            self.misses += len(missing)
+        logging.debug(f'ee cache: {len(results)} hits, {len(missing)} misses')
+
+        if missing:
+            evaluated = self.evaluate(missing)
+            for name in missing.keys():
+                self._store(keys[name], evaluated[name])
+                results[name] = evaluated[name]
+            with self.lock:
+                self.evict()
+        return results
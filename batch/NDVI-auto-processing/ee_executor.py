@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+# bounded concurrent earth engine evaluation with a rate limiter and backoff on 429 responses
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _evaluate(ee_object):
+    return ee_object.getInfo()
+
+
+def _is_rate_limited(error):
+    message = str(error)
+    return '429' in message or 'Too Many Requests' in message
+
+
+class TokenBucket:
+    # allows bursts of up to capacity requests and rate requests per second on average
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EEExecutor:
+    # tasks run on one pool and evaluations on another, so a task waiting for its evaluations never blocks them
+
+    def __init__(
+        self,
+        max_workers=4,
+        max_concurrent_requests=4,
+        requests_per_second=2,
+        burst=4,
+        max_retries=6,
+        base_delay=1.0,
+        evaluate=_evaluate
+    ):
+        self.task_pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.evaluation_pool = ThreadPoolExecutor(max_workers=max_concurrent_requests)
+        self.limiter = TokenBucket(requests_per_second, burst)
+        # caps the requests in flight, also when evaluate() is called directly from a task
+        self.slots = threading.BoundedSemaphore(max_concurrent_requests)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._evaluate = evaluate
+
+    def evaluate(self, ee_object):
+        # blocking evaluation within the quota, retried with exponential backoff when rate limited
+        return self.call(self._evaluate, ee_object)
+
+    def call(self, fn, *args, **kwargs):
+        # any earth engine request (e.g. ee.data.computePixels) under the same quota and backoff as evaluate
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            with self.slots:
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if not _is_rate_limited(e) or attempt == self.max_retries:
+                        raise
+            delay = self.base_delay * 2 ** attempt + random.uniform(0, self.base_delay)
+            logging.debug(f'Rate limited, retrying in {delay:.1f} s')
+            time.sleep(delay)
+
+    def evaluate_many(self, ee_objects, return_exceptions=False):
+        # independent evaluations run concurrently, the wall time follows the slowest one
+        # with return_exceptions a failed evaluation returns its exception instead of raising it
+        futures = {
+            name: self.evaluation_pool.submit(self.evaluate, ee_object)
+            for name, ee_object in ee_objects.items()
+        }
+        if not return_exceptions:
+            return {name: future.result() for name, future in futures.items()}
+        return {name: future.exception() or future.result() for name, future in futures.items()}
+
+    def submit(self, fn, *args, **kwargs):
+        return self.task_pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        self.task_pool.shutdown()
+        self.evaluation_pool.shutdown()
@@ -0,0 +1,302 @@
+# -*- coding: UTF-8 -*-
+# local geometry preparation: simplified and rounded AOIs for filterBounds, and the map framing of each feature
+import copy
+import hashlib
+import json
+import math
+from pathlib import Path
+import numpy as np
+from definitions import *
+
+earth_radius = 6371008.8
+
+
+def _distance(point, start, end):
+    # distance of point to the segment start-end in degrees
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(point[0] - start[0], point[1] - start[1])
+    t = max(0, min(1, ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(point[0] - start[0] - t * dx, point[1] - start[1] - t * dy)
+
+
+def simplify_ring(ring, tolerance):
+    # douglas-peucker, rings that would collapse below a triangle are kept as they are
+    keep = [False] * len(ring)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_distance, index = 0, None
+        for i in range(first + 1, last):
+            distance = _distance(ring[i], ring[first], ring[last])
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    simplified = [point for point, kept in zip(ring, keep) if kept]
+    return simplified if len(simplified) >= 4 else ring
+
+
+def _polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def simplify_geo_data(geo_data, tolerance=simplify_tolerance, precision=coordinate_precision):
+    # copy of the feature collection with simplified rings and rounded coordinates
+    simplified = copy.deepcopy(geo_data)
+    for feature in simplified['features']:
+        for polygon in _polygons(feature['geometry']):
+            for i, ring in enumerate(polygon):
+                ring = simplify_ring(ring, tolerance)
+                polygon[i] = [[round(coordinate, precision) for coordinate in point[:2]] for point in ring]
+    return simplified
+
+
+def ring_area(ring):
+    # planar area in m² on an equirectangular projection around the ring, close enough for AOIs of a city
+    lat0 = math.radians(sum(point[1] for point in ring) / len(ring))
+    scale = math.pi / 180 * earth_radius
+    xy = [(point[0] * scale * math.cos(lat0), point[1] * scale) for point in ring]
+    return abs(sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(xy, xy[1:] + xy[:1]))) / 2
+
+
+def area(geo_data):
+    # outer rings minus holes of all features
+    return sum(
+        ring_area(polygon[0]) - sum(ring_area(hole) for hole in polygon[1:])
+        for feature in geo_data['features']
+        for polygon in _polygons(feature['geometry'])
+    )
+
+
+def vertex_count(geo_data):
+    return sum(
+        len(ring)
+        for feature in geo_data['features']
+        for polygon in _polygons(feature['geometry'])
+        for ring in polygon
+    )
+
+
+def prepare_geometry(geo_data, tolerance=simplify_tolerance, precision=coordinate_precision):
+    # the simplified geometry and the relative area error it introduces
+    simplified = simplify_geo_data(geo_data, tolerance, precision)
+    exact_area = area(geo_data)
+    area_error = abs(area(simplified) - exact_area) / exact_area if exact_area else 0
+    print(f'Simplified geometry: {vertex_count(geo_data)} -> {vertex_count(simplified)} vertices, area error {area_error:.4%}')
+    return simplified, area_error
+
+
+def ring_arrays(feature):
+    # one (n, 2) lon/lat array per ring, outer rings and holes in file order with their sign (+1 outer, -1 hole)
+    return [
+        (np.asarray(ring, dtype=np.float64)[:, :2], 1 if i == 0 else -1)
+        for polygon in _polygons(feature['geometry'])
+        for i, ring in enumerate(polygon)
+    ]
+
+
+def _signed_areas(rings):
+    # shoelace area and centroid of each ring in degrees², holes count negative
+    areas = []
+    centroids = []
+    for ring, sign in rings:
+        x, y = ring[:, 0], ring[:, 1]
+        x1, y1 = np.roll(x, -1), np.roll(y, -1)
+        cross = x * y1 - x1 * y
+        ring_area = cross.sum() / 2
+        if ring_area == 0:
+            areas.append(0.0)
+            centroids.append(ring.mean(axis=0))
+            continue
+        centroids.append(np.array([((x + x1) * cross).sum(), ((y + y1) * cross).sum()]) / (6 * ring_area))
+        areas.append(sign * abs(ring_area))
+    return np.array(areas), np.array(centroids)
+
+
+def feature_framing(feature):
+    # bbox (xmin, ymin, xmax, ymax), area-weighted centroid (lon, lat) and area in m² of one feature
+    rings = ring_arrays(feature)
+    coords = np.concatenate([ring for ring, _ in rings])
+    areas, centroids = _signed_areas(rings)
+    centroid = (areas[:, None] * centroids).sum(axis=0) / areas.sum() if areas.sum() else coords.mean(axis=0)
+    # degrees² to m² on an equirectangular projection around the centroid
+    scale = math.pi / 180 * earth_radius
+    return {
+        'bbox': np.concatenate([coords.min(axis=0), coords.max(axis=0)]),
+        'centroid': centroid,
+        'area': areas.sum() * scale * scale * math.cos(math.radians(centroid[1])),
+    }
+
+
+def collection_framing(framings):
+    # framing of several features from their own framings
+    bboxes = np.array([framing['bbox'] for framing in framings])
+    areas = np.array([framing['area'] for framing in framings])
+    centroids = np.array([framing['centroid'] for framing in framings])
+    return {
+        'bbox': np.concatenate([bboxes[:, :2].min(axis=0), bboxes[:, 2:].max(axis=0)]),
+        'centroid': (areas[:, None] * centroids).sum(axis=0) / areas.sum() if areas.sum() else centroids.mean(axis=0),
+        'area': areas.sum(),
+    }
+
+
+def geo_data_framing(geo_data):
+    # framing of a feature collection, computed without any earth engine call
+    return collection_framing([feature_framing(feature) for feature in geo_data['features']])
+
+
+def folium_bounds(framing):
+    # folium takes [[south, west], [north, east]]
+    xmin, ymin, xmax, ymax = framing['bbox']
+    return [[float(ymin), float(xmin)], [float(ymax), float(xmax)]]
+
+
+def folium_location(framing):
+    return [float(framing['centroid'][1]), float(framing['centroid'][0])]
+
+
+def load_feature_framings(geojson_path, geo_data=None):
+    # per-feature framings of a geojson file, cached next to it and recomputed when the file changes
+    geojson_path = Path(geojson_path)
+    cache_path = geojson_path.with_name(f'{geojson_path.name}.framing.npz')
+    file_hash = hashlib.sha256(geojson_path.read_bytes()).hexdigest()
+    try:
+        with np.load(cache_path) as cached:
+            if str(cached['file_hash']) == file_hash:
+                return [
+                    {'bbox': bbox, 'centroid': centroid, 'area': feature_area}
+                    for bbox, centroid, feature_area in zip(cached['bbox'], cached['centroid'], cached['area'])
+                ]
+    except (OSError, KeyError, ValueError):
+        pass
+
+    if geo_data is None:
+        with open(geojson_path, 'r') as f:
+            geo_data = json.load(f)
+    framings = [feature_framing(feature) for feature in geo_data['features']]
+    try:
+        np.savez(
+            cache_path,
+            file_hash=np.array(file_hash),
+            bbox=np.array([framing['bbox'] for framing in framings]),
+            centroid=np.array([framing['centroid'] for framing in framings]),
+            area=np.array([framing['area'] for framing in framings]))
+    except OSError:
+        # a read-only project folder only loses the cache
+        pass
+    return framings
+
+
+def _edges(geometry):
+    # start and end points of all ring edges of a Polygon or MultiPolygon, holes included
+    rings = [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in _polygons(geometry) for ring in polygon]
+    rings = [ring for ring in rings if len(ring) > 1]
+    if not rings:
+        return np.zeros((0, 2)), np.zeros((0, 2)), np.zeros((0, 2))
+    # one vertex per ring is enough to detect containment once no edges cross
+    return (np.concatenate([ring[:-1] for ring in rings]), np.concatenate([ring[1:] for ring in rings]),
+        np.array([ring[0] for ring in rings]))
+
+
+def _inside(points, start, end):
+    # even-odd rule over all edges, so points in holes are outside
+    y = points[:, 1][:, None]
+    crossing = (start[:, 1] <= y) != (end[:, 1] <= y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = start[:, 0] + (y - start[:, 1]) * (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1])
+    return (crossing & (points[:, 0][:, None] < x)).sum(axis=1) % 2 == 1
+
+
+def _orientation(a, b, c):
+    return (b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) - (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0])
+
+
+def _edges_cross(start, end, other_start, other_end, chunk=1024):
+    # true when any edge touches or crosses any other edge
+    other_start, other_end = other_start[None, :], other_end[None, :]
+    for i in range(0, len(start), chunk):
+        a, b = start[i:i + chunk, None], end[i:i + chunk, None]
+        crossing = (
+            (_orientation(other_start, other_end, a) * _orientation(other_start, other_end, b) <= 0)
+            & (_orientation(a, b, other_start) * _orientation(a, b, other_end) <= 0)
+            # rules out collinear edges that do not overlap
+            & (np.minimum(a[..., 0], b[..., 0]) <= np.maximum(other_start[..., 0], other_end[..., 0]))
+            & (np.minimum(other_start[..., 0], other_end[..., 0]) <= np.maximum(a[..., 0], b[..., 0]))
+            & (np.minimum(a[..., 1], b[..., 1]) <= np.maximum(other_start[..., 1], other_end[..., 1]))
+            & (np.minimum(other_start[..., 1], other_end[..., 1]) <= np.maximum(a[..., 1], b[..., 1])))
+        if crossing.any():
+            return True
+    return False
+
+
+def geometries_intersect(geometry, other_geometry):
+    # exact test of two Polygon or MultiPolygon geometries in lon/lat, touching counts as intersecting
+    start, end, vertices = _edges(geometry)
+    other_start, other_end, other_vertices = _edges(other_geometry)
+    if not len(start) or not len(other_start):
+        return False
+    points = np.concatenate([start, end])
+    other_points = np.concatenate([other_start, other_end])
+    if (points.min(axis=0) > other_points.max(axis=0)).any() or (other_points.min(axis=0) > points.max(axis=0)).any():
+        return False
+    return (_inside(vertices, other_start, other_end).any()
+        or _inside(other_vertices, start, end).any()
+        or _edges_cross(start, end, other_start, other_end))
+
+
+def geo_data_intersect(geo_data, other_geo_data):
+    # true when any feature of one collection intersects any feature of the other
+    framings = [feature_framing(feature) for feature in geo_data['features']]
+    other_framings = [feature_framing(feature) for feature in other_geo_data['features']]
+    for feature, framing in zip(geo_data['features'], framings):
+        for other_feature, other_framing in zip(other_geo_data['features'], other_framings):
+            bbox, other_bbox = framing['bbox'], other_framing['bbox']
+            if (bbox[:2] > other_bbox[2:]).any() or (other_bbox[:2] > bbox[2:]).any():
+                continue
+            if geometries_intersect(feature['geometry'], other_feature['geometry']):
+                return True
+    return False
+
+
+def raster_grid(geo_data, scale=stats_scale):
+    # transform (as in rasterize) and shape of a north-up EPSG:4326 grid over the AOI with pixels of about scale metres
+    xmin, ymin, xmax, ymax = (float(value) for value in geo_data_framing(geo_data)['bbox'])
+    degree = math.pi / 180 * earth_radius
+    dy = scale / degree
+    dx = scale / (degree * math.cos(math.radians((ymin + ymax) / 2)))
+    return (xmin, ymax, dx, dy), (max(1, math.ceil((ymax - ymin) / dy)), max(1, math.ceil((xmax - xmin) / dx)))
+
+
+def rasterize(geo_data, transform, shape):
+    # boolean AOI mask of a north-up raster, a pixel is inside when its centre is (even-odd rule per feature)
+    # transform is (x of the left edge, y of the top edge, pixel width, pixel height) in degrees
+    x0, y0, dx, dy = transform
+    rows, columns = shape
+    mask = np.zeros(shape, dtype=bool)
+    column_centres = x0 + (np.arange(columns) + 0.5) * dx
+    for feature in geo_data['features']:
+        rings = [ring for ring, _ in ring_arrays(feature)]
+        if not rings:
+            continue
+        # all edges of the feature, holes included
+        start = np.concatenate([ring[:-1] for ring in rings])
+        end = np.concatenate([ring[1:] for ring in rings])
+        for row in range(rows):
+            y = y0 - (row + 0.5) * dy
+            crossing = (start[:, 1] <= y) != (end[:, 1] <= y)
+            if not crossing.any():
+                continue
+            s, e = start[crossing], end[crossing]
+            xs = np.sort(s[:, 0] + (y - s[:, 1]) * (e[:, 0] - s[:, 0]) / (e[:, 1] - s[:, 1]))
+            # the centres between each pair of crossings are inside
+            for x_in, x_out in zip(xs[0::2], xs[1::2]):
+                mask[row] |= (column_centres >= x_in) & (column_centres < x_out)
+    return mask
@@ -14,6 +14,16 @@ import time
 from send_email import sendEmail, open_project_date
 from xhtml2pdf import pisa
 from definitions import *
+from ee_cache import EECache
+from ee_executor import EEExecutor
+from scene_catalog import SceneCatalog, scene_collection, max_cloudy_pixel_percentage
+from stats_store import MosaicStatsStore, aoi_hash
+from report_cache import ReportCache
+from ndvi_histogram import histogram_from_groups, histogram_groups, histogram_area, no_ndvi_bin, vegetation_area, threshold_stats
+from geometry import prepare_geometry, simplify_geo_data, geo_data_framing, geo_data_intersect, load_feature_framings, folium_bounds, folium_location, raster_grid, rasterize
+from pixel_cache import PixelCache, EEPixelFetcher
+from raster_cube import RasterCube, raster_cube_path
+from threshold_history import ThresholdHistory, threshold_history_path
 from shutil import copy
 from pprint import pprint as pp
 
@@ -134,31 +144,66 @@ def maskS2clouds(image):
     return image
 
 
-# NDVI function
-def add_NDVI(image, geometry_feature):
-    # for the area we assume the pixels are 10x10m also we know that there is up to 0.01% variance due to the projection used. This can be improved by using areaPixel = ndvi.multiply(ee.Image.pixelArea()).rename('area_m2')
-    ndvi = image.normalizedDifference(['B8', 'B4']).rename('ndvi')
-    thres = ndvi.gte(0.2).rename('thres')
-    ndvi02_area = thres.multiply(ee.Image.pixelArea()).rename('ndvi02_area')
-
-    # calculate ndvi > 0.2 area
-    ndviStats = ndvi02_area.reduceRegion(
-        reducer=ee.Reducer.sum(),
+def _NDVIHistogram(image, ndvi, geometry_feature):
+    # area per NDVI bin in one grouped reduction as [{'bin': k, 'sum': area}, ...],
+    # bin k holds the pixels with NDVI in [k, k + 1) / ndvi_histogram_bins
+    # the area is masked by B1 like the area of add_NDVI, pixels without NDVI go to the no_ndvi_bin
+    # the product with ndvi_histogram_bins can round across a bin edge (0.29 * 100 < 29), so the bin is corrected
+    # by comparing NDVI with its edges the way add_NDVI compares it with ndvi_threshold
+    ndvi_value = ndvi.toDouble()
+    ndvi_bin = ndvi_value.multiply(ndvi_histogram_bins).floor()
+    ndvi_bin = (ndvi_bin
+        .subtract(ndvi_value.lt(ndvi_bin.divide(ndvi_histogram_bins)))
+        .add(ndvi_value.gte(ndvi_bin.add(1).divide(ndvi_histogram_bins))))
+    ndvi_bin = (ndvi_bin
+        .clamp(-ndvi_histogram_bins, ndvi_histogram_bins - 1)
+        .int()
+        .unmask(no_ndvi_bin())
+        .rename('bin'))
+    pixel_area = image.select('B1').multiply(0).add(1).multiply(ee.Image.pixelArea())
+    histogram = pixel_area.addBands(ndvi_bin).reduceRegion(
+        reducer=ee.Reducer.sum().group(groupField=1, groupName='bin'),
         geometry=geometry_feature,
-        scale=10,
+        scale=stats_scale,
         maxPixels=1e29
     )
+    return ee.List(histogram.get('groups'))
 
-    image = image.set(ndviStats)
+
+# NDVI function
+def add_NDVI(image, geometry_feature, stats=None, histogram=False):
+    # histogram reduces the NDVI histogram instead of the threshold area, ndvi02_area and area are summed from its bins
+    # for the area we assume the pixels are 10x10m also we know that there is up to 0.01% variance due to the projection used. This can be improved by using areaPixel = ndvi.multiply(ee.Image.pixelArea()).rename('area_m2')
+    ndvi = image.normalizedDifference(['B8', 'B4']).rename('ndvi')
+    thres = ndvi.gte(ndvi_threshold).rename('thres')
+
+    # stats of this mosaic are already known from the mosaic stats store, no reduction needed
+    if stats is not None:
+        image = image.set(stats)
+        image = image.addBands(thres)
+        return image
+
+    if histogram:
+        groups = _NDVIHistogram(image, ndvi, geometry_feature)
+        bins = ee.FeatureCollection(groups.map(lambda group: ee.Feature(None, group)))
+        image = image.set({
+            'ndvi02_area': bins.filter(ee.Filter.gte('bin', round(ndvi_threshold * ndvi_histogram_bins))).aggregate_sum('sum'),
+            'area': bins.aggregate_sum('sum'),
+            'ndvi_histogram': groups,
+        })
+        image = image.addBands(thres)
+        return image
+
+    ndvi02_area = thres.multiply(ee.Image.pixelArea()).rename('ndvi02_area')
 
     # calculate area of AOI
     area = image.select('B1').multiply(0).add(1).multiply(ee.Image.pixelArea()).rename('area')
 
-    # calculate area
-    img_stats = area.reduceRegion(
+    # calculate ndvi > 0.2 area and area of AOI in one pass, the sum is applied per band with its own mask
+    img_stats = ndvi02_area.addBands(area).reduceRegion(
         reducer=ee.Reducer.sum(),
         geometry=geometry_feature,
-        scale=10,
+        scale=stats_scale,
         maxPixels=1e29
     )
 
@@ -247,20 +292,23 @@ def convert_html_to_pdf(source_html, output_filename):
     return pisa_status.err
 
 
-## Mosaic function
-def CreateMosaic(d1, geometry_feature):
-    days_in_interval = 40
+def _MosaicWindow(scenes, d1, geometry_feature, optimised=True, keep_qa=False):
     start = ee.Date(d1)
     end = ee.Date(d1).advance(days_in_interval, 'days')
     date_range = ee.DateRange(start, end)
     name = start.format('YYYY-MM-dd').cat(' to ').cat(end.format('YYYY-MM-dd'))
 
-    ic = (ee.ImageCollection('COPERNICUS/S2_HARMONIZED')
-        .filterDate(date_range)
-        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 1))
-        .filterBounds(geometry_feature)
-        .map(lambda image: image.clip(geometry_feature))
-        .mosaic())
+    if optimised:
+        # only the bands read downstream (plus QA60 for maskS2clouds), clipped once after the mosaic
+        bands = mosaic_bands + [mosaic_qa_band] if keep_qa else mosaic_bands
+        ic = (scenes
+            .select(bands)
+            .mosaic()
+            .clip(geometry_feature))
+    else:
+        ic = (scenes
+            .map(lambda image: image.clip(geometry_feature))
+            .mosaic())
 
     return ic.set(
         "system:time_start", start.millis(),
@@ -269,41 +317,67 @@ def CreateMosaic(d1, geometry_feature):
         "range", date_range)
 
 
-def GenerateReport(collection, timeframe_delta, geometry_feature, screenshot_save_name, project_name):
-    timeframe_collection = collection.filterDate(timeframe_delta['start_date'], timeframe_delta['end_date'])
-    ndvi_timeframe_collection = timeframe_collection.map(lambda x: add_NDVI(x, geometry_feature))
-    ndvi_img_start = ee.Image(ndvi_timeframe_collection.toList(ndvi_timeframe_collection.size()).get(0))
-    ndvi_img_end = ee.Image(ndvi_timeframe_collection.toList(ndvi_timeframe_collection.size()).get(ndvi_timeframe_collection.size().subtract(1)))
-
-    # if there is no different image within that timeframe just take the next best
-    if timeframe_collection.size().getInfo() > 1:
-        latest_image = ee.Image(timeframe_collection.toList(timeframe_collection.size()).get(timeframe_collection.size().subtract(1)))
-        first_image = ee.Image(timeframe_collection.toList(timeframe_collection.size()).get(0))
+## Mosaic function
+def CreateMosaic(d1, geometry_feature, optimised=True, keep_qa=False):
+    start = ee.Date(d1)
+    end = ee.Date(d1).advance(days_in_interval, 'days')
+    date_range = ee.DateRange(start, end)
 
-        latest_image_date = latest_image.date().format("dd.MM.YYYY").getInfo()
-        first_image_date = first_image.date().format("dd.MM.YYYY").getInfo()
-    else:
-        latest_image = ee.Image(collection.toList(collection.size()).get(collection.size().subtract(1)))
-        first_image = ee.Image(collection.toList(collection.size()).get(collection.size().subtract(2)))
+    scenes = (ee.ImageCollection(scene_collection)
+        .filterDate(date_range)
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloudy_pixel_percentage))
+        .filterBounds(geometry_feature))
 
-        latest_image_date = latest_image.date().format("dd.MM.YYYY").getInfo()
-        first_image_date = first_image.date().format("dd.MM.YYYY").getInfo()
+    return _MosaicWindow(scenes, d1, geometry_feature, optimised, keep_qa)
 
-        ndvi_img_start = ee.Image(add_NDVI(first_image, geometry_feature))
-        ndvi_img_end = ee.Image(add_NDVI(latest_image, geometry_feature))
 
-    # prepare values for report
-    project_area = ndvi_img_start.getNumber('area').getInfo()
+def CreateMosaicFromScenes(d1, scene_ids, geometry_feature, optimised=True, keep_qa=False):
+    # same mosaic as CreateMosaic, but the scenes were already selected in the local scene catalog
+    scenes = ee.ImageCollection([ee.Image(f'{scene_collection}/{scene_id}') for scene_id in scene_ids])
+    return _MosaicWindow(scenes, d1, geometry_feature, optimised, keep_qa)
 
-    vegetation_start = ndvi_img_start.getNumber('ndvi02_area').getInfo()
-    vegetation_end = ndvi_img_end.getNumber('ndvi02_area').getInfo()
 
-    area_change = (vegetation_end-vegetation_start)
+def SelectEndpoints(collection, timeframe_delta):
+    # picks the first and latest mosaic of a timeframe before any statistics are attached to them
+    timeframe_collection = collection.filterDate(timeframe_delta['start_date'], timeframe_delta['end_date'])
 
-    relative_change = 100 - (vegetation_end/vegetation_start) * 100
-    vegetation_share_start = (vegetation_start/project_area) * 100
-    vegetation_share_end = (vegetation_end/project_area) * 100
-    vegetation_share_change = vegetation_share_end - vegetation_share_start
+    # if there is no different image within that timeframe just take the next best
+    has_timeframe_pair = timeframe_collection.size().gt(1)
+    first_image = ee.Image(ee.Algorithms.If(
+        has_timeframe_pair,
+        timeframe_collection.limit(1, 'system:time_start').first(),
+        collection.limit(2, 'system:time_start', False).toList(2).get(1)))
+    latest_image = ee.Image(ee.Algorithms.If(
+        has_timeframe_pair,
+        timeframe_collection.limit(1, 'system:time_start', False).first(),
+        collection.limit(1, 'system:time_start', False).first()))
+    return first_image, latest_image
+
+
+def SelectLocalEndpoints(windows, py_timeframe_delta):
+    # same choice as SelectEndpoints, answered from the (window_start, scene_ids) list of the scene catalog
+    timeframe_windows = [
+        window for window in windows
+        if py_timeframe_delta['start_date'] <= window[0] < py_timeframe_delta['end_date']
+    ]
+    if len(timeframe_windows) > 1:
+        return timeframe_windows[0], timeframe_windows[-1]
+    if len(windows) < 2:
+        raise ValueError(f'{len(windows)} non-empty mosaic windows, a timeframe needs two')
+    return windows[-2], windows[-1]
+
+
+def _ReportImages(collection, timeframe_delta, geometry_feature, endpoints=None):
+    # endpoints are the (ndvi_img_start, ndvi_img_end) when they were already prepared locally
+    if endpoints is None:
+        first_image, latest_image = SelectEndpoints(collection, timeframe_delta)
+
+        # only the two endpoint mosaics need NDVI statistics
+        endpoints = (
+            ee.Image(add_NDVI(first_image, geometry_feature)),
+            ee.Image(add_NDVI(latest_image, geometry_feature))
+        )
+    ndvi_img_start, ndvi_img_end = endpoints
 
     # Calculate difference between the two datasets
     growth_decline_img = ndvi_img_end.subtract(ndvi_img_start).select('thres')
@@ -319,65 +393,572 @@ def GenerateReport(collection, timeframe_delta, geometry_feature, screenshot_sav
         scale=10,
         maxPixels=1e29)
 
-    vegetation_gain = ee.Number(vegetation_stats_gain.get('thres')).multiply(100).round().getInfo()
+    return ndvi_img_start, ndvi_img_end, growth_decline_img, vegetation_stats_gain
+
+
+def _ReportStats(collection, timeframe_delta, geometry_feature, endpoints=None, histogram=False):
+    # builds every scalar the report needs as one server-side dictionary
+    # with histogram the endpoints come from add_NDVI(histogram=True) and their histograms are added
+    ndvi_img_start, ndvi_img_end, growth_decline_img, vegetation_stats_gain = _ReportImages(
+        collection, timeframe_delta, geometry_feature, endpoints)
+
+    # the timeframe dates are left out so the graph only depends on the endpoint mosaics
+    stats = ee.Dictionary({
+        'start_date_satellite': ndvi_img_start.date().format("dd.MM.YYYY"),
+        'end_date_satellite': ndvi_img_end.date().format("dd.MM.YYYY"),
+        'project_area': ndvi_img_start.getNumber('area'),
+        'project_area_end': ndvi_img_end.getNumber('area'),
+        'vegetation_start': ndvi_img_start.getNumber('ndvi02_area'),
+        'vegetation_end': ndvi_img_end.getNumber('ndvi02_area'),
+        'vegetation_gain': ee.Number(vegetation_stats_gain.get('thres')).multiply(100).round(),
+    })
+    if histogram:
+        stats = stats.combine({
+            'ndvi_histogram_start': ndvi_img_start.get('ndvi_histogram'),
+            'ndvi_histogram_end': ndvi_img_end.get('ndvi_histogram'),
+        })
+    return stats, growth_decline_img
+
+
+batch_columns = ['batch_key', 'vegetation_start', 'project_area', 'vegetation_end', 'project_area_end', 'vegetation_gain']
+
+
+def _ReportStatsImage(ndvi_img_start, ndvi_img_end):
+    # the bands whose sums are the report statistics, for the batched and the tiled reductions
+    growth_decline_img = ndvi_img_end.subtract(ndvi_img_start).select('thres')
+    growth_img = growth_decline_img.updateMask(growth_decline_img.eq(1))
+    growth_decline_img = growth_decline_img.updateMask(growth_decline_img.neq(0))
+
+    # same bands as add_NDVI and _ReportImages reduce, the sum is applied per band with its own mask
+    pixel_area = ee.Image.pixelArea()
+    stats_img = ee.Image.cat([
+        ndvi_img_start.select('thres').multiply(pixel_area).rename('vegetation_start'),
+        ndvi_img_start.select('B1').multiply(0).add(1).multiply(pixel_area).rename('project_area'),
+        ndvi_img_end.select('thres').multiply(pixel_area).rename('vegetation_end'),
+        ndvi_img_end.select('B1').multiply(0).add(1).multiply(pixel_area).rename('project_area_end'),
+        growth_img.rename('vegetation_gain'),
+    ])
+    return stats_img, growth_decline_img
+
+
+def _TimeframeDates(timeframe_name, timeframe_windows):
+    # the report dates of a timeframe and its endpoint windows, known locally
+    py_timeframe_delta = get_py_timeframes()[timeframe_name]
+    (start_window, _), (end_window, _) = timeframe_windows
+    return {
+        'start_date': py_timeframe_delta['start_date'].strftime("%d.%m.%Y"),
+        'end_date': py_timeframe_delta['end_date'].strftime("%d.%m.%Y"),
+        'start_date_satellite': start_window.strftime("%d.%m.%Y"),
+        'end_date_satellite': end_window.strftime("%d.%m.%Y"),
+    }
+
+
+def _LocalStats(timeframe_name, timeframe_windows, sums):
+    # the _ReportStats values from the band sums of _ReportStatsImage
+    return {
+        **_TimeframeDates(timeframe_name, timeframe_windows),
+        'project_area': sums['project_area'],
+        'project_area_end': sums['project_area_end'],
+        'vegetation_start': sums['vegetation_start'],
+        'vegetation_end': sums['vegetation_end'],
+        'vegetation_gain': round(sums['vegetation_gain'] * 100),
+    }
+
+
+def _BatchRows(stats_img, geometry_feature):
+    # per-feature counterpart of _ReportStats: one reduceRegions of a _ReportStatsImage over every feature
+    # of the collection, returned as one row of batch_columns per feature
+    feature_stats = stats_img.reduceRegions(
+        collection=geometry_feature,
+        reducer=ee.Reducer.sum(),
+        scale=stats_scale)
+
+    # only the columns, the geometries are not sent back
+    return feature_stats.reduceColumns(ee.Reducer.toList(len(batch_columns)), batch_columns).get('list')
+
+
+def _BatchSums(rows):
+    # the band sums per batch_key, a feature with several geometries or a tiled reduction has several rows
+    sums = {}
+    for row in rows:
+        feature_sums = sums.setdefault(int(row[0]), dict.fromkeys(batch_columns[1:], 0))
+        for column, value in zip(batch_columns[1:], row[1:]):
+            # a geometry or tile without any pixel sums to nothing
+            feature_sums[column] += value or 0
+    return sums
+
+
+def _TileBounds(bounds, tiles_per_side):
+    xmin, ymin, xmax, ymax = bounds
+    dx = (xmax - xmin) / tiles_per_side
+    dy = (ymax - ymin) / tiles_per_side
+    return [
+        (xmin + i * dx, ymin + j * dy, xmin + (i + 1) * dx, ymin + (j + 1) * dy)
+        for j in range(tiles_per_side)
+        for i in range(tiles_per_side)
+    ]
+
+
+def _TileIndexImage(bounds, tiles_per_side):
+    # index of the grid tile that holds the centre of each pixel, pixels just outside the bounds go to the edge tiles
+    xmin, ymin, xmax, ymax = bounds
+    lon_lat = ee.Image.pixelLonLat()
+    column = (lon_lat.select('longitude').subtract(xmin).divide((xmax - xmin) / tiles_per_side)
+        .floor().clamp(0, tiles_per_side - 1))
+    row = (lon_lat.select('latitude').subtract(ymin).divide((ymax - ymin) / tiles_per_side)
+        .floor().clamp(0, tiles_per_side - 1))
+    return row.multiply(tiles_per_side).add(column).int()
+
+
+def _EvaluateTiles(requests, executor, max_tile_retries=3):
+    # failed tiles are retried on their own, the finished ones are kept
+    tile_results = {}
+    pending = requests
+    for attempt in range(max_tile_retries + 1):
+        results = executor.evaluate_many(pending, return_exceptions=True)
+        failed = {index: result for index, result in results.items() if isinstance(result, Exception)}
+        tile_results.update({index: result for index, result in results.items() if index not in failed})
+        if not failed:
+            break
+        if attempt == max_tile_retries:
+            raise next(iter(failed.values()))
+        print(f'Retrying {len(failed)} of {len(requests)} tiles after: {next(iter(failed.values()))}')
+        pending = {index: requests[index] for index in failed.keys()}
+    return tile_results
+
+
+def TiledReduceRegion(images, geo_data, executor, tiles_per_side=4, max_tile_retries=3):
+    # band sums of each of the images over geo_data, reduced concurrently in a tiles_per_side x tiles_per_side grid
+    # every tile reduces the full geometry, but only the pixels whose centre lies in the tile, so each pixel
+    # is counted in exactly one tile and the merged sums match the single reduceRegion
+    bounds = _Bounds(geo_data)
+    geometry = ee.FeatureCollection(geo_data).geometry()
+    tile_index = _TileIndexImage(bounds, tiles_per_side)
+    requests = {}
+    for index, tile_bounds in enumerate(_TileBounds(bounds, tiles_per_side)):
+        # the clip keeps the server from computing the pixels of the other tiles, the buffer covers edge pixels
+        tile = ee.Geometry.Rectangle(list(tile_bounds)).buffer(2 * stats_scale)
+        requests[index] = ee.Dictionary({
+            name: image.updateMask(tile_index.eq(index)).clip(tile).reduceRegion(
+                reducer=ee.Reducer.sum(),
+                geometry=geometry,
+                scale=stats_scale,
+                maxPixels=1e29)
+            for name, image in images.items()
+        })
+
+    tile_sums = _EvaluateTiles(requests, executor, max_tile_retries)
+
+    sums = {name: {} for name in images.keys()}
+    for index in sorted(tile_sums.keys()):
+        for name, band_sums in tile_sums[index].items():
+            for band, value in band_sums.items():
+                # a tile without any pixel of the AOI sums to nothing
+                sums[name][band] = sums[name].get(band, 0) + (value or 0)
+    return sums
+
+
+def TiledBatchRows(stats_imgs, geo_data, geometry_feature, executor, tiles_per_side=4, max_tile_retries=3):
+    # _BatchRows of each of the stats_imgs, reduced concurrently in a tiles_per_side x tiles_per_side grid over
+    # the bounds of geo_data, every pixel is counted in one tile and _BatchSums adds the rows of the tiles
+    bounds = _Bounds(geo_data)
+    tile_index = _TileIndexImage(bounds, tiles_per_side)
+    requests = {}
+    for index, tile_bounds in enumerate(_TileBounds(bounds, tiles_per_side)):
+        tile = ee.Geometry.Rectangle(list(tile_bounds)).buffer(2 * stats_scale)
+        requests[index] = ee.Dictionary({
+            name: _BatchRows(stats_img.updateMask(tile_index.eq(index)).clip(tile), geometry_feature)
+            for name, stats_img in stats_imgs.items()
+        })
+    tile_rows = _EvaluateTiles(requests, executor, max_tile_retries)
+    return {
+        name: [row for index in sorted(tile_rows.keys()) for row in tile_rows[index][name]]
+        for name in stats_imgs.keys()
+    }
+
+
+def _ApproximateReportStats(collection, timeframe_delta, geometry_feature, geo_data, endpoints=None):
+    # sampled counterpart of _ReportStats: threshold classes of the endpoints at a stratified random sample of
+    # pixels, stratified by grid tile, and the area of each stratum from a coarse reduction
+    # endpoints are threshold-only add_NDVI images, e.g. from _EndpointImages, instead of SelectEndpoints
+    if endpoints is not None:
+        ndvi_img_start, ndvi_img_end = endpoints
+    else:
+        first_image, latest_image = SelectEndpoints(collection, timeframe_delta)
+        # the threshold band only, the statistics are estimated from the sample
+        ndvi_img_start = ee.Image(add_NDVI(first_image, geometry_feature, stats={}))
+        ndvi_img_end = ee.Image(add_NDVI(latest_image, geometry_feature, stats={}))
+
+    growth_decline_img = ndvi_img_end.subtract(ndvi_img_start).select('thres')
+    growth_decline_img = growth_decline_img.updateMask(growth_decline_img.neq(0))
+
+    stratum = _TileIndexImage(_Bounds(geo_data), approximate_strata_per_side).rename('stratum')
+    samples = ee.Image.cat([
+        ndvi_img_start.select('thres').rename('thres_start'),
+        ndvi_img_end.select('thres').rename('thres_end'),
+        stratum,
+    ]).stratifiedSample(
+        numPoints=approximate_points_per_stratum,
+        classBand='stratum',
+        region=geometry_feature.geometry(),
+        scale=stats_scale,
+        seed=0,
+        dropNulls=True,
+        geometries=False)
+    strata_area = (ee.Image.pixelArea()
+        .updateMask(ndvi_img_start.select('thres').mask())
+        .addBands(stratum)
+        .reduceRegion(
+            reducer=ee.Reducer.sum().group(groupField=1, groupName='stratum'),
+            geometry=geometry_feature,
+            scale=approximate_area_scale,
+            maxPixels=1e29))
+
+    stats = ee.Dictionary({
+        'start_date_satellite': ndvi_img_start.date().format("dd.MM.YYYY"),
+        'end_date_satellite': ndvi_img_end.date().format("dd.MM.YYYY"),
+        'samples': samples.reduceColumns(ee.Reducer.toList(3), ['stratum', 'thres_start', 'thres_end']).get('list'),
+        'strata_area': strata_area.get('groups'),
+    })
+    return stats, growth_decline_img
+
+
+def _EstimateStats(stats, z=1.96):
+    # stratified estimates of the vegetation areas in m² and their confidence intervals (95 % for z=1.96),
+    # None when there is no sample at all, e.g. for a small or fully masked AOI
+    strata = {}
+    for stratum, thres_start, thres_end in stats['samples']:
+        strata.setdefault(int(stratum), []).append((thres_start, thres_end))
+    # a stratum too small to get a sample falls back to the proportions of the whole sample
+    all_samples = [sample for samples in strata.values() for sample in samples]
+    if not all_samples:
+        return None
+    indicators = {
+        'vegetation_start': lambda thres_start, thres_end: thres_start == 1,
+        'vegetation_end': lambda thres_start, thres_end: thres_end == 1,
+        'vegetation_gain': lambda thres_start, thres_end: thres_start == 0 and thres_end == 1,
+        'vegetation_loss': lambda thres_start, thres_end: thres_start == 1 and thres_end == 0,
+    }
+
+    estimates = {'project_area': sum(group['sum'] for group in stats['strata_area'])}
+    confidence_intervals = {}
+    for name, indicator in indicators.items():
+        total = 0
+        variance = 0
+        for group in stats['strata_area']:
+            samples = strata.get(int(group['stratum'])) or all_samples
+            share = sum(indicator(*sample) for sample in samples) / len(samples)
+            total += group['sum'] * share
+            if len(samples) > 1:
+                variance += group['sum'] ** 2 * share * (1 - share) / (len(samples) - 1)
+        margin = z * variance ** 0.5
+        estimates[name] = total
+        confidence_intervals[name] = [total - margin, total + margin]
+
+    # the report derives the loss as area_change - vegetation_gain, which is the negative loss area
+    estimates.pop('vegetation_loss')
+    low, high = confidence_intervals['vegetation_loss']
+    confidence_intervals['vegetation_loss'] = [-high, -low]
+    estimates['vegetation_gain'] = round(estimates['vegetation_gain'])
+    return estimates, confidence_intervals
+
+
+def _CompileReport(stats, screenshot_save_name, project_name):
+    # derive the report values from the scalars fetched from earth engine
+    project_area = stats['project_area']
+    vegetation_start = stats['vegetation_start']
+    vegetation_end = stats['vegetation_end']
+    vegetation_gain = stats['vegetation_gain']
+
+    area_change = (vegetation_end-vegetation_start)
+
+    # an empty mosaic over the feature gives zero areas, its shares are reported as 0 instead of failing the run
+    if project_area == 0 or vegetation_start == 0:
+        print(f"{project_name}: no vegetation or no project area at the start of the timeframe, relative values set to 0")
+    relative_change = 100 - (vegetation_end/vegetation_start) * 100 if vegetation_start else 0
+    vegetation_share_start = (vegetation_start/project_area) * 100 if project_area else 0
+    vegetation_share_end = (vegetation_end/project_area) * 100 if project_area else 0
+    vegetation_share_change = vegetation_share_end - vegetation_share_start
 
     vegetation_loss = area_change - vegetation_gain
-    vegetation_loss_relative = -vegetation_loss / project_area * 100
-    vegetation_gain_relative = vegetation_gain / project_area * 100
+    vegetation_loss_relative = -vegetation_loss / project_area * 100 if project_area else 0
+    vegetation_gain_relative = vegetation_gain / project_area * 100 if project_area else 0
 
     if area_change < 0:
         relative_change = -relative_change
 
-    
+    # the sparse histograms go into the project history, so other thresholds can be reported later without a request
+    histogram_stats = {}
+    if 'ndvi_histogram_start' in stats:
+        histogram_start = histogram_from_groups(stats['ndvi_histogram_start'])
+        histogram_end = histogram_from_groups(stats['ndvi_histogram_end'])
+        histogram_stats = {
+            'ndvi_histogram_start': histogram_start,
+            'ndvi_histogram_end': histogram_end,
+            'vegetation_thresholds': threshold_stats(histogram_start, histogram_end),
+        }
+
+    return {
+        'start_date': stats['start_date'],
+        'end_date': stats['end_date'],
+        'start_date_satellite': stats['start_date_satellite'],
+        'end_date_satellite': stats['end_date_satellite'],
+        'vegetation_start': vegetation_start,
+        'vegetation_end': vegetation_end,
+        'vegetation_share_start': vegetation_share_start,
+        'vegetation_share_end': vegetation_share_end,
+        'vegetation_share_change': vegetation_share_change,
+        'project_area': project_area/(1000*1000),
+        'area_change': area_change,
+        'relative_change': relative_change,
+        'vegetation_gain': vegetation_gain,
+        'vegetation_loss': vegetation_loss,
+        'vegetation_gain_relative': vegetation_gain_relative,
+        'vegetation_loss_relative': vegetation_loss_relative,
+        'path': screenshot_save_name,
+        'project_name': project_name,
+        **histogram_stats,
+    }
+
+
+def LatestSceneDate(geometry_feature):
+    # metadata only: the newest acquisition over the AOI that passes the cloud filter, no pixels are read
+    latest_scene = (ee.ImageCollection(scene_collection)
+        .filterDate(ee.Date(window_origin), ee.Date(py_date))
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloudy_pixel_percentage))
+        .filterBounds(geometry_feature)
+        .aggregate_max('system:time_start')
+        .getInfo())
+    if latest_scene is None:
+        return None
+    # ee.Date treats naive datetimes as UTC
+    return datetime.utcfromtimestamp(latest_scene / 1000)
+
+
+def LastReportedDate(json_file_name):
+    # newest end_date_satellite of the last entry in the project history
+    try:
+        with open(json_file_name, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        last_entry = data[list(data.keys())[-1]]
+        return max(
+            datetime.strptime(report['end_date_satellite'], "%d.%m.%Y")
+            for report in last_entry.values()
+        )
+    except Exception:
+        return None
+
+
+def HasNewScene(geometry_feature, json_file_name, catalog=None, scene_ids=None):
+    # cheap check before building the pipeline: one round trip and no map or pdf work
+    # scene_ids limits a catalog probe to the scenes over this feature, for catalogs shared by a batch
+    if catalog is not None:
+        # the catalog is already up to date, so the probe is answered locally
+        latest_scene_date = catalog.latest_scene_date(scene_ids=scene_ids)
+    else:
+        latest_scene_date = LatestSceneDate(geometry_feature)
+    if latest_scene_date is None:
+        print('No scene found for the AOI.')
+        return False
+    latest_window = get_window_start(latest_scene_date).strftime("%d.%m.%Y")
+    last_reported = LastReportedDate(json_file_name)
+    if last_reported is not None and last_reported.strftime("%d.%m.%Y") == latest_window:
+        print(f'No new data for {processing_date}. Newest scene from {latest_scene_date:%d.%m.%Y} is in the last reported window {latest_window}.')
+        return False
+    return True
+
+
+def GenerateReport(collection, timeframe_delta, geometry_feature, screenshot_save_name, project_name, single_request=False, approximate=False, geo_data=None):
+    # single_request fetches all report values with one evaluate call instead of one getInfo per value
+    # approximate estimates the areas from a stratified sample of pixels instead of the exact 10 m sums,
+    # it needs the geo_data of geometry_feature for the strata and tags the report as approximate
+    if approximate:
+        stats, growth_decline_img = _ApproximateReportStats(collection, timeframe_delta, geometry_feature, geo_data)
+        stats = stats.combine({
+            'start_date': timeframe_delta['start_date'].format("dd.MM.YYYY"),
+            'end_date': timeframe_delta['end_date'].format("dd.MM.YYYY"),
+        }).getInfo()
+        estimated = _EstimateStats(stats)
+        if estimated is not None:
+            estimates, confidence_intervals = estimated
+            report = _CompileReport({**stats, **estimates}, screenshot_save_name, project_name)
+            report['approximate'] = True
+            report['confidence_intervals'] = confidence_intervals
+            return {
+                "report": report,
+                "growth_decline_img": growth_decline_img
+            }
+        # without any sampled pixel there is nothing to estimate from, the exact sums are cheap for such an AOI
+        print(f"{project_name}: no sampled pixels, reduced exactly")
+        single_request = True
+
+    if single_request:
+        stats, growth_decline_img = _ReportStats(collection, timeframe_delta, geometry_feature)
+        stats = stats.combine({
+            'start_date': timeframe_delta['start_date'].format("dd.MM.YYYY"),
+            'end_date': timeframe_delta['end_date'].format("dd.MM.YYYY"),
+        })
+        return {
+            "report": _CompileReport(stats.getInfo(), screenshot_save_name, project_name),
+            "growth_decline_img": growth_decline_img
+        }
+
+    ndvi_img_start, ndvi_img_end, growth_decline_img, vegetation_stats_gain = _ReportImages(
+        collection, timeframe_delta, geometry_feature)
+
+    # prepare values for report
+    stats = {
+        'start_date': timeframe_delta['start_date'].format("dd.MM.YYYY").getInfo(),
+        'end_date': timeframe_delta['end_date'].format("dd.MM.YYYY").getInfo(),
+        'start_date_satellite': ndvi_img_start.date().format("dd.MM.YYYY").getInfo(),
+        'end_date_satellite': ndvi_img_end.date().format("dd.MM.YYYY").getInfo(),
+        'project_area': ndvi_img_start.getNumber('area').getInfo(),
+        'vegetation_start': ndvi_img_start.getNumber('ndvi02_area').getInfo(),
+        'vegetation_end': ndvi_img_end.getNumber('ndvi02_area').getInfo(),
+        'vegetation_gain': ee.Number(vegetation_stats_gain.get('thres')).multiply(100).round().getInfo(),
+    }
+
     return {
-        "report": {
-            'start_date': timeframe_delta['start_date'].format("dd.MM.YYYY").getInfo(),
-            'end_date': timeframe_delta['end_date'].format("dd.MM.YYYY").getInfo(),
-            'start_date_satellite': first_image_date,
-            'end_date_satellite': latest_image_date,
-            'vegetation_start': vegetation_start,
-            'vegetation_end': vegetation_end,
-            'vegetation_share_start': vegetation_share_start,
-            'vegetation_share_end': vegetation_share_end,
-            'vegetation_share_change': vegetation_share_change,
-            'project_area': project_area/(1000*1000),
-            'area_change': area_change,
-            'relative_change': relative_change,
-            'vegetation_gain': vegetation_gain,
-            'vegetation_loss': vegetation_loss,
-            'vegetation_gain_relative': vegetation_gain_relative,
-            'vegetation_loss_relative': vegetation_loss_relative,
-            'path': screenshot_save_name,
-            'project_name': project_name,
-        },
+        "report": _CompileReport(stats, screenshot_save_name, project_name),
         "growth_decline_img": growth_decline_img
     }
 
-def _SaveMap(geo_data, growth_decline_img, screenshot_save_name):
-    coords = list(geojson.utils.coords(geo_data))
-    starting_coord = [*coords[0]]
-    print(starting_coord)
-    merged_poly =  {
-        "type": "Feature",
-        "properties": {},
-        "geometry": {
-            "type": "MultiPolygon",
-            "coordinates": [[[[*i] for i in coords]]]
+def GenerateFeatureReports(collection, timeframes, geometry_feature, screenshot_save_names, project_name, endpoints=None, cache=None, executor=None, histogram=False):
+    # evaluates the statistics of all timeframes of one feature with a single request
+    # histogram needs endpoints from add_NDVI(histogram=True)
+    endpoints = endpoints or {}
+    growth_decline_imgs = {}
+    feature_stats = {}
+    for timeframe_name, timeframe_delta in timeframes.items():
+        stats, growth_decline_img = _ReportStats(
+            collection, timeframe_delta, geometry_feature, endpoints.get(timeframe_name), histogram)
+        feature_stats[timeframe_name] = stats
+        growth_decline_imgs[timeframe_name] = growth_decline_img
+
+    # endpoints from the scene catalog pin their scene ids, so the graph fully determines the result
+    cacheable_stats = {
+        timeframe_name: stats for timeframe_name, stats in feature_stats.items()
+        if cache is not None and timeframe_name in endpoints
+    }
+    remote_stats = {
+        timeframe_name: stats for timeframe_name, stats in feature_stats.items()
+        if timeframe_name not in cacheable_stats
+    }
+    feature_stats = cache.get_info_many(cacheable_stats) if cacheable_stats else {}
+    if remote_stats:
+        remote_stats = ee.Dictionary(remote_stats)
+        feature_stats.update(executor.evaluate(remote_stats) if executor is not None else remote_stats.getInfo())
+
+    # same values as formatting the ee timeframes on the server
+    py_timeframes = get_py_timeframes()
+    for timeframe_name in timeframes.keys():
+        feature_stats[timeframe_name]['start_date'] = py_timeframes[timeframe_name]['start_date'].strftime("%d.%m.%Y")
+        feature_stats[timeframe_name]['end_date'] = py_timeframes[timeframe_name]['end_date'].strftime("%d.%m.%Y")
+
+    return {
+        timeframe_name: {
+            "report": _CompileReport(
+                feature_stats[timeframe_name],
+                screenshot_save_names[timeframe_name],
+                project_name),
+            "growth_decline_img": growth_decline_imgs[timeframe_name],
+            "stats": feature_stats[timeframe_name]
         }
+        for timeframe_name in timeframes.keys()
     }
 
-    merged_poly["geometry"]["coordinates"][0][0].append(starting_coord)
+def GenerateTiledReports(endpoints, endpoint_windows, geo_data, screenshot_save_names, project_name, executor, tiles_per_side=4):
+    # like GenerateFeatureReports, but for AOIs too large for one reduceRegion all statistics are reduced in tiles
+    stats_imgs = {}
+    growth_decline_imgs = {}
+    for timeframe_name, (ndvi_img_start, ndvi_img_end) in endpoints.items():
+        stats_imgs[timeframe_name], growth_decline_imgs[timeframe_name] = _ReportStatsImage(ndvi_img_start, ndvi_img_end)
+    sums = TiledReduceRegion(stats_imgs, geo_data, executor, tiles_per_side)
+
+    reports = {}
+    for timeframe_name in endpoints.keys():
+        stats = _LocalStats(timeframe_name, endpoint_windows[timeframe_name], sums[timeframe_name])
+        reports[timeframe_name] = {
+            "report": _CompileReport(stats, screenshot_save_names[timeframe_name], project_name),
+            "growth_decline_img": growth_decline_imgs[timeframe_name],
+            "stats": stats
+        }
+    return reports
+
+def GenerateApproximateReports(endpoint_windows, geometry_feature, geo_data, screenshot_save_names, project_name, executor):
+    # like GenerateTiledReports, but the areas are estimated from a stratified sample of pixels as in
+    # GenerateReport(approximate=True), timeframes without any sampled pixel are left out for the exact reduction
+    endpoint_images = _EndpointImages(endpoint_windows, geometry_feature, lambda window_start, scene_ids: {})
+    requests = {}
+    growth_decline_imgs = {}
+    for timeframe_name, timeframe_windows in endpoint_windows.items():
+        endpoints = tuple(
+            endpoint_images[_EndpointKey(window_start, scene_ids)] for window_start, scene_ids in timeframe_windows)
+        requests[timeframe_name], growth_decline_imgs[timeframe_name] = _ApproximateReportStats(
+            None, None, geometry_feature, geo_data, endpoints)
+    samples = executor.evaluate_many(requests)
+
+    reports = {}
+    for timeframe_name, sampled in samples.items():
+        estimated = _EstimateStats(sampled)
+        if estimated is None:
+            print(f"{project_name}: no sampled pixels in {timeframe_name}, reduced exactly")
+            continue
+        estimates, confidence_intervals = estimated
+        # the sample covers both endpoints, so the start area serves for the end as well
+        stats = {
+            **_TimeframeDates(timeframe_name, endpoint_windows[timeframe_name]),
+            **estimates,
+            'project_area_end': estimates['project_area'],
+        }
+        report = _CompileReport(stats, screenshot_save_names[timeframe_name], project_name)
+        report['approximate'] = True
+        report['confidence_intervals'] = confidence_intervals
+        reports[timeframe_name] = {
+            "report": report,
+            "growth_decline_img": growth_decline_imgs[timeframe_name],
+            "stats": stats
+        }
+    return reports
+
+
+def GenerateLocalReports(endpoints, endpoint_windows, geo_data, screenshot_save_names, project_name, pixel_cache):
+    # like GenerateTiledReports, but the statistics are computed locally from the B4/B8 pixels of the endpoint mosaics,
+    # which are kept in the raster cube of the AOI, and compared through the threshold history of their thres bands,
+    # only the maps are still rendered on the server
+    transform, shape = raster_grid(geo_data)
+    cube = RasterCube(Path(raster_cube_path) / aoi_hash(geo_data), shape=shape, transform=transform)
+    history = ThresholdHistory(Path(threshold_history_path) / aoi_hash(geo_data))
+    aoi_mask = rasterize(geo_data, transform, shape)
+    reports = {}
+    for timeframe_name, (ndvi_img_start, ndvi_img_end) in endpoints.items():
+        for window_start, scene_ids in endpoint_windows[timeframe_name]:
+            if history.has(window_start, scene_ids):
+                continue
+            # a window that is not in the cube yet or gained a late scene is downloaded once through the pixel cache
+            if not cube.has(window_start, scene_ids):
+                band_arrays, _ = pixel_cache.read(window_start, scene_ids, geo_data)
+                cube.append(window_start, band_arrays, scene_ids)
+            history.put_bands(
+                window_start, cube.read(window_start, 'B4'), cube.read(window_start, 'B8'), aoi_mask, scene_ids=scene_ids)
+        (start_window, _), (end_window, _) = endpoint_windows[timeframe_name]
+        sums = history.compare(start_window, end_window)
+        _, growth_decline_img = _ReportStatsImage(ndvi_img_start, ndvi_img_end)
+        stats = _LocalStats(timeframe_name, endpoint_windows[timeframe_name], sums)
+        reports[timeframe_name] = {
+            "report": _CompileReport(stats, screenshot_save_names[timeframe_name], project_name),
+            "growth_decline_img": growth_decline_img,
+            "stats": stats
+        }
+    return reports
 
-    swapped_coords = [[x[1], x[0]] for x in coords]
-    
-    html_map = 'map.html'
 
-    # Define center of our map
-    centroid = ee.Geometry(merged_poly["geometry"]).centroid().getInfo()['coordinates']
+def _SaveMap(geo_data, growth_decline_img, screenshot_save_name):
+    html_map = 'map.html'
 
-    # get coordinates from centroid for folium
-    lat, lon = centroid[1], centroid[0]
-    my_map = folium.Map(location=[lat, lon], zoom_control=False, control_scale=True)
+    # centre and bounds come from the local framing, no earth engine call is needed
+    framing = geo_data.get("framing") or geo_data_framing(geo_data)
+    my_map = folium.Map(location=folium_location(framing), zoom_control=False, control_scale=True)
     basemaps['Google Satellite'].add_to(my_map)
 
     growth_vis_params = {
@@ -398,7 +979,7 @@ def _SaveMap(geo_data, growth_decline_img, screenshot_save_name):
         my_map.add_ee_layer(growth_decline_img, growth_vis_params, 'Growth and decline image')
 
     # fit bounds for optimal zoom level
-    my_map.fit_bounds(swapped_coords)
+    my_map.fit_bounds(folium_bounds(framing))
 
     my_map.save(html_map)
 
@@ -439,6 +1020,7 @@ def SaveReport(
         timeframe_name, 
         res,
         geo_data, 
+        report_cache=None,
         ):
     new_report = False
     with open(json_file_name, 'r', encoding='utf-8') as f:
@@ -461,11 +1043,18 @@ def SaveReport(
             tmp = data.get(processing_date, {})
             tmp[timeframe_name] = report 
             data[processing_date] = tmp
-            SaveMap(
-                geo_data, 
-                res["growth_decline_img"],
-                report["path"]
-            )
+            jpeg = Path(report["path"]).with_suffix('.jpeg')
+            if res.get("cached_image") is not None:
+                # endpoints unchanged since the cached report, so its map still shows the same change
+                copy(res["cached_image"], jpeg)
+            else:
+                SaveMap(
+                    geo_data, 
+                    res["growth_decline_img"],
+                    report["path"]
+                )
+                if report_cache is not None and res.get("report_cache_key") is not None:
+                    report_cache.put(res["report_cache_key"], report, jpeg)
         else:
             print(f'No new data for {processing_date}.')
     with open(json_file_name, 'w', encoding='utf-8') as f:
@@ -506,28 +1095,38 @@ def GeneratePdf(data, report, logo_path, source_html_path, pdf_path):
     pisa.showLogging()
     convert_html_to_pdf(soup.prettify(), pdf_path)
 
+def _ScreenshotSaveNames(output_folder, screenshot_save_name_base):
+    return {
+        timeframe_name: f'{output_folder}/{screenshot_save_name_base}_{processing_date}_{timeframe_name}.png'
+        for timeframe_name in get_py_timeframes().keys()
+    }
+
 def ProcessCollection(
         collection, 
         geo_data, 
         json_path,
         screenshot_save_name_base,
-        output_folder
+        output_folder,
+        reports=None,
+        report_cache=None
     ):
+    # reports can be passed in when the statistics were already evaluated, e.g. concurrently by Run
     name = geo_data["name"]
     geometry_feature = ee.FeatureCollection(geo_data)
     image_list = []
     new_report = False
     _, timeframes = get_timeframes()
-    for timeframe_name, timeframe_delta in timeframes.items():
-        screenshot_save_name = f'{output_folder}/{screenshot_save_name_base}_{processing_date}_{timeframe_name}.png'
-        print(f"Generating report for {timeframe_name} for {name}")
-        res = GenerateReport(
-            collection=collection, 
-            timeframe_delta=timeframe_delta, 
+    if reports is None:
+        print(f"Generating reports for {name}")
+        reports = GenerateFeatureReports(
+            collection=collection,
+            timeframes=timeframes,
             geometry_feature=geometry_feature,
-            screenshot_save_name=screenshot_save_name,
+            screenshot_save_names=_ScreenshotSaveNames(output_folder, screenshot_save_name_base),
             project_name=geo_data["name"]
             )
+    for timeframe_name in timeframes.keys():
+        res = reports[timeframe_name]
         report = res["report"]
         first_image_date = datetime.strptime(report["start_date_satellite"], "%d.%m.%Y")
         latest_image_date = datetime.strptime(report["end_date_satellite"], "%d.%m.%Y")
@@ -548,6 +1147,7 @@ def ProcessCollection(
             timeframe_name, 
             res,
             geo_data=geo_data,  
+            report_cache=report_cache,
             )
         if new_report:
             image_list.append(report["path"])
@@ -586,7 +1186,9 @@ def ProcessFeature(
     output_folder,
     logo,
     local_test_run,
-    email_test_run
+    email_test_run,
+    reports=None,
+    report_cache=None
 ):
     data = {}
     with open(json_file_name, 'a', encoding='utf-8') as f:
@@ -602,7 +1204,9 @@ def ProcessFeature(
         geo_data=geo_data, 
         json_path=json_file_name,
         output_folder=output_folder,
-        screenshot_save_name_base=screenshot_save_name_base
+        screenshot_save_name_base=screenshot_save_name_base,
+        reports=reports,
+        report_cache=report_cache
     )
 
     pdf_prefix = '..' if local_test_run else ''
@@ -636,6 +1240,435 @@ def ProcessFeature(
     )
 
 
+def _EndpointKey(window_start, scene_ids):
+    return window_start, tuple(scene_ids)
+
+
+def _EndpointImages(endpoint_windows, geometry_feature, get_stats, clip_geometry=None, histogram=False):
+    # one NDVI image per distinct endpoint mosaic, shared by every timeframe that starts or ends on it,
+    # so its region statistics appear once in the request graph
+    # get_stats(window_start, scene_ids) returns the known statistics of a mosaic or None to reduce it
+    clip_geometry = clip_geometry or geometry_feature
+    endpoint_images = {}
+    for timeframe_windows in endpoint_windows.values():
+        for window_start, scene_ids in timeframe_windows:
+            key = _EndpointKey(window_start, scene_ids)
+            if key in endpoint_images:
+                continue
+            endpoint_images[key] = ee.Image(add_NDVI(
+                CreateMosaicFromScenes(window_start, scene_ids, clip_geometry),
+                geometry_feature,
+                get_stats(window_start, scene_ids),
+                histogram))
+    return endpoint_images
+
+
+def _CachedReport(cached, timeframe_name, screenshot_save_name):
+    # a report from the report cache, the timeframe itself still moves with the processing date
+    report, image_path = cached
+    py_timeframe_delta = get_py_timeframes()[timeframe_name]
+    report.update({
+        'start_date': py_timeframe_delta['start_date'].strftime("%d.%m.%Y"),
+        'end_date': py_timeframe_delta['end_date'].strftime("%d.%m.%Y"),
+        'path': screenshot_save_name,
+    })
+    return {
+        "report": report,
+        "growth_decline_img": None,
+        "cached_image": image_path
+    }
+
+
+def _StoredHistogramStats(store, aoi, window_start, scene_ids):
+    # add_NDVI stats of a mosaic from its stored histogram, or None to reduce it
+    histogram = store.get_histogram(aoi, window_start, scene_ids)
+    if histogram is None:
+        return None
+    return {
+        'ndvi02_area': vegetation_area(histogram),
+        'area': histogram_area(histogram),
+        'ndvi_histogram': histogram_groups(histogram),
+    }
+
+
+def _EvaluateFeature(feature, screenshot_save_name_base, output_folder, email_test_run, executor, cache, report_cache, tiles_per_side=None, histogram=False, pixel_cache=None, approximate=False):
+    # all earth engine work of one feature, returns None when there is no new scene
+    # tiles_per_side reduces the statistics in a grid of tiles instead of one reduceRegion per value,
+    # histogram reduces the NDVI histogram of each endpoint mosaic and adds report_thresholds to the reports,
+    # pixel_cache computes the statistics locally from the cached pixels of the endpoint mosaics,
+    # approximate estimates them from a stratified sample and reduces exactly only when the sample is empty
+    geometry_feature = ee.FeatureCollection(feature)
+    snake_case_name = feature["name"].lower().replace(' ', '_')
+    json_file_name = f"{snake_case_name}.json"
+
+    # only scenes newer than the catalog are requested, everything else is answered locally,
+    # filterBounds only needs the simplified geometry
+    catalog = SceneCatalog(f"{snake_case_name}_scenes.sqlite")
+    simplified_geo_data, _ = prepare_geometry(feature)
+    catalog.update(ee.FeatureCollection(simplified_geo_data), evaluate=executor.evaluate)
+
+    # email test runs resend the last report, so they skip the probe
+    if not email_test_run and not HasNewScene(geometry_feature, json_file_name, catalog):
+        catalog.close()
+        return None
+
+    ### calculate NDVI
+    # windows without a scene under the cloud threshold would become empty mosaics
+    windows = catalog.non_empty_windows()
+    catalog.close()
+    if len(windows) < 2:
+        # a new AOI or a short catalog, the report needs two mosaics
+        print(f"{feature['name']}: fewer than two mosaics with scenes over the feature, no report")
+        return None
+    collection = ee.ImageCollection([
+        CreateMosaicFromScenes(window_start, scene_ids, geometry_feature)
+        for window_start, scene_ids in windows
+    ])
+    endpoint_windows = {
+        timeframe_name: SelectLocalEndpoints(windows, py_timeframe_delta)
+        for timeframe_name, py_timeframe_delta in get_py_timeframes().items()
+    }
+
+    # timeframes whose endpoint mosaics did not change reuse their report and map without any request
+    aoi = aoi_hash(feature)
+    report_cache_keys = {
+        timeframe_name: report_cache.key(
+            aoi, timeframe_name, timeframe_windows, histogram=histogram, local_stats=pixel_cache is not None,
+            tiles_per_side=tiles_per_side, approximate=approximate)
+        for timeframe_name, timeframe_windows in endpoint_windows.items()
+    }
+    cached_reports = {
+        timeframe_name: report_cache.get(key)
+        for timeframe_name, key in report_cache_keys.items()
+    }
+    cached_reports = {
+        timeframe_name: cached for timeframe_name, cached in cached_reports.items()
+        if cached is not None
+    }
+    endpoint_windows = {
+        timeframe_name: timeframe_windows for timeframe_name, timeframe_windows in endpoint_windows.items()
+        if timeframe_name not in cached_reports
+    }
+
+    # mosaics reduced in an earlier run only get their stored statistics attached,
+    # in tiled and local mode the endpoints only need their threshold band
+    store = MosaicStatsStore()
+    if tiles_per_side or pixel_cache is not None:
+        get_stats = lambda window_start, scene_ids: {}
+    elif histogram:
+        get_stats = lambda window_start, scene_ids: _StoredHistogramStats(store, aoi, window_start, scene_ids)
+    else:
+        get_stats = lambda window_start, scene_ids: store.get(aoi, window_start, scene_ids)
+    endpoint_images = _EndpointImages(endpoint_windows, geometry_feature, get_stats, histogram=histogram)
+    endpoints = {
+        timeframe_name: tuple(
+            endpoint_images[_EndpointKey(window_start, scene_ids)]
+            for window_start, scene_ids in timeframe_windows
+        )
+        for timeframe_name, timeframe_windows in endpoint_windows.items()
+    }
+
+    _, timeframes = get_timeframes()
+    timeframes = {
+        timeframe_name: timeframe_delta for timeframe_name, timeframe_delta in timeframes.items()
+        if timeframe_name not in cached_reports
+    }
+    screenshot_save_name_base = f"{snake_case_name}_{screenshot_save_name_base}"
+    screenshot_save_names = _ScreenshotSaveNames(output_folder, screenshot_save_name_base)
+    print(f"Generating reports for {feature['name']}, {len(cached_reports)} timeframes cached")
+    reports = {}
+    if timeframes and approximate:
+        reports = GenerateApproximateReports(
+            endpoint_windows=endpoint_windows,
+            geometry_feature=geometry_feature,
+            geo_data=feature,
+            screenshot_save_names=screenshot_save_names,
+            project_name=feature["name"],
+            executor=executor
+        )
+    approximated = set(reports.keys())
+    timeframes = {
+        timeframe_name: timeframe_delta for timeframe_name, timeframe_delta in timeframes.items()
+        if timeframe_name not in approximated
+    }
+    endpoints = {
+        timeframe_name: timeframe_endpoints for timeframe_name, timeframe_endpoints in endpoints.items()
+        if timeframe_name not in approximated
+    }
+    if timeframes and pixel_cache is not None:
+        reports = GenerateLocalReports(
+            endpoints=endpoints,
+            endpoint_windows=endpoint_windows,
+            geo_data=feature,
+            screenshot_save_names=screenshot_save_names,
+            project_name=feature["name"],
+            pixel_cache=pixel_cache
+        )
+    elif timeframes and tiles_per_side:
+        reports = GenerateTiledReports(
+            endpoints=endpoints,
+            endpoint_windows=endpoint_windows,
+            geo_data=feature,
+            screenshot_save_names=screenshot_save_names,
+            project_name=feature["name"],
+            executor=executor,
+            tiles_per_side=tiles_per_side
+        )
+    elif timeframes:
+        reports = GenerateFeatureReports(
+            collection=collection,
+            timeframes=timeframes,
+            geometry_feature=geometry_feature,
+            screenshot_save_names=screenshot_save_names,
+            project_name=feature["name"],
+            endpoints=endpoints,
+            cache=cache,
+            executor=executor,
+            histogram=histogram
+        )
+    for timeframe_name in list(timeframes.keys()) + list(approximated):
+        reports[timeframe_name]["report_cache_key"] = report_cache_keys[timeframe_name]
+
+    for timeframe_name, cached in cached_reports.items():
+        reports[timeframe_name] = _CachedReport(cached, timeframe_name, screenshot_save_names[timeframe_name])
+
+    # one entry per distinct mosaic, whichever timeframe reported it first
+    endpoint_stats = {}
+    endpoint_histograms = {}
+    for timeframe_name, ((start_window, start_scene_ids), (end_window, end_scene_ids)) in endpoint_windows.items():
+        # estimates are no mosaic statistics
+        if timeframe_name in approximated:
+            continue
+        stats = reports[timeframe_name]["stats"]
+        endpoint_stats.setdefault(
+            _EndpointKey(start_window, start_scene_ids),
+            {'ndvi02_area': stats['vegetation_start'], 'area': stats['project_area']})
+        endpoint_stats.setdefault(
+            _EndpointKey(end_window, end_scene_ids),
+            {'ndvi02_area': stats['vegetation_end'], 'area': stats['project_area_end']})
+        if histogram:
+            report = reports[timeframe_name]["report"]
+            endpoint_histograms.setdefault(_EndpointKey(start_window, start_scene_ids), report['ndvi_histogram_start'])
+            endpoint_histograms.setdefault(_EndpointKey(end_window, end_scene_ids), report['ndvi_histogram_end'])
+    # local statistics are not stored, the pixel grid differs slightly from the server reduction,
+    # histogram statistics only go to the histogram table, mosaic_stats keeps the areas of add_NDVI's own reduction
+    if pixel_cache is None and not histogram:
+        for (window_start, scene_ids), stats in endpoint_stats.items():
+            store.put(aoi, window_start, scene_ids, stats)
+    for (window_start, scene_ids), endpoint_histogram in endpoint_histograms.items():
+        store.put_histogram(aoi, window_start, scene_ids, endpoint_histogram)
+    store.close()
+
+    return {
+        "feature": feature,
+        "collection": collection,
+        "json_file_name": json_file_name,
+        "screenshot_save_name_base": screenshot_save_name_base,
+        "reports": reports,
+    }
+
+
+def _Bounds(geo_data):
+    # (xmin, ymin, xmax, ymax) of all coordinates, computed locally
+    coords = list(geojson.utils.coords(geo_data))
+    xs = [coord[0] for coord in coords]
+    ys = [coord[1] for coord in coords]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _BoundingBox(geo_data):
+    # a rectangle is far cheaper to clip to than the union of many polygons
+    return ee.Geometry.Rectangle(list(_Bounds(geo_data)))
+
+
+def GroupOverlappingProjects(project_geo_data):
+    # indices of the projects whose areas contain or overlap each other, directly or through another project,
+    # the geometries are intersected exactly, so projects whose bounding boxes merely overlap stay apart
+    groups = []
+    for index, geo_data in enumerate(project_geo_data):
+        overlapping = [
+            group for group in groups
+            if any(geo_data_intersect(geo_data, project_geo_data[other]) for other in group)
+        ]
+        merged = sorted([index] + [other for group in overlapping for other in group])
+        groups = [group for group in groups if group not in overlapping] + [merged]
+    return groups
+
+
+def _SplitFeatures(geo_data, name=None, framings=None):
+    # one geo_data per feature, named by REF_CL_CAT or by the project name for single area projects,
+    # the project name defaults to the name of the geojson, e.g. 'Riyadh City'
+    # framings from load_feature_framings are attached for the maps
+    name = name or geo_data.get("name")
+    return [
+        {
+            "type": geo_data["type"],
+            "crs": geo_data["crs"],
+            "features": [i],
+            "name": i["properties"].get("REF_CL_CAT", name),
+            "framing": framings[index] if framings is not None else None
+        }
+        for index, i in enumerate(geo_data["features"])
+    ]
+
+
+def _EvaluateFeatures(batch_features, email_test_run, executor, cache, report_cache, tiles_per_side=None, histogram=False, pixel_cache=None, approximate=False):
+    # _EvaluateFeature for each of the batch_features of _EvaluateBatch, with the same result format
+    evaluated_features = []
+    for batch_feature in batch_features:
+        evaluated = _EvaluateFeature(
+            batch_feature["feature"], batch_feature["screenshot_save_name_base"], batch_feature["output_folder"],
+            email_test_run, executor, cache, report_cache, tiles_per_side, histogram, pixel_cache, approximate)
+        if evaluated is not None:
+            evaluated_features.append({**batch_feature, **evaluated})
+    return evaluated_features
+
+
+def _EvaluateBatch(batch_features, batch_name, email_test_run, executor, cache, report_cache, tiles_per_side=None):
+    # batched counterpart of _EvaluateFeature: one mosaic collection for all features and one reduceRegions
+    # per timeframe, split into the per-feature results
+    # tiles_per_side splits each reduceRegions into a grid of tiles, for batches as large as RUH
+    # batch_features are dicts with the feature, its screenshot_save_name_base and output_folder,
+    # any other keys are passed through to the result
+    reduction_geo_data = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": i["geometry"], "properties": {"batch_key": batch_key}}
+            for batch_key, batch_feature in enumerate(batch_features)
+            for i in batch_feature["feature"]["features"]
+        ]
+    }
+    geometry_feature = ee.FeatureCollection(reduction_geo_data)
+    catalog = SceneCatalog(f"{batch_name}_scenes.sqlite")
+    simplified_geo_data, _ = prepare_geometry(reduction_geo_data)
+    catalog.update(ee.FeatureCollection(simplified_geo_data), evaluate=executor.evaluate)
+
+    windows = catalog.non_empty_windows()
+    if len(windows) < 2:
+        print(f"{batch_name}: fewer than two mosaics with scenes over the batch, no report")
+        catalog.close()
+        return []
+    endpoint_windows = {
+        timeframe_name: SelectLocalEndpoints(windows, py_timeframe_delta)
+        for timeframe_name, py_timeframe_delta in get_py_timeframes().items()
+    }
+
+    evaluated_features = {}
+    fallback_features = []
+    for batch_key, batch_feature in enumerate(batch_features):
+        feature = batch_feature["feature"]
+        snake_case_name = feature["name"].lower().replace(' ', '_')
+        json_file_name = f"{snake_case_name}.json"
+        # the batch catalog holds the scenes of all features, each feature only looks at the scenes over it
+        scene_ids = catalog.intersecting_scene_ids(simplify_geo_data(feature))
+        if not email_test_run and not HasNewScene(ee.FeatureCollection(feature), json_file_name, catalog, scene_ids):
+            continue
+        feature_windows = catalog.non_empty_windows(scene_ids=scene_ids)
+        if len(feature_windows) < 2:
+            print(f"{feature['name']}: fewer than two mosaics with scenes over the feature, no report")
+            continue
+        # a feature without a scene in one of the shared endpoint windows would be reduced over an empty mosaic,
+        # it is evaluated on its own endpoints instead
+        feature_endpoint_starts = {
+            timeframe_name: [window_start for window_start, _ in SelectLocalEndpoints(feature_windows, py_timeframe_delta)]
+            for timeframe_name, py_timeframe_delta in get_py_timeframes().items()
+        }
+        if any(
+            feature_endpoint_starts[timeframe_name] != [window_start for window_start, _ in timeframe_windows]
+            for timeframe_name, timeframe_windows in endpoint_windows.items()
+        ):
+            print(f"{feature['name']}: endpoint mosaics differ from the batch, evaluated on its own")
+            fallback_features.append(batch_feature)
+            continue
+        feature_screenshot_save_name_base = f"{snake_case_name}_{batch_feature['screenshot_save_name_base']}"
+        evaluated_features[batch_key] = {
+            **batch_feature,
+            "json_file_name": json_file_name,
+            "screenshot_save_name_base": feature_screenshot_save_name_base,
+            "screenshot_save_names": _ScreenshotSaveNames(batch_feature["output_folder"], feature_screenshot_save_name_base),
+            "aoi": aoi_hash(feature),
+            "reports": {},
+        }
+    catalog.close()
+
+    # a feature of a tiled batch is tiled on its own as well
+    fallback_evaluations = _EvaluateFeatures(
+        fallback_features, email_test_run, executor, cache, report_cache, tiles_per_side=tiles_per_side)
+    if not evaluated_features:
+        return fallback_evaluations
+
+    # the mosaics are shared by all features and only clipped to their bounding box,
+    # each feature is cut out by reduceRegions and for its map
+    bounding_box = _BoundingBox(reduction_geo_data)
+    collection = ee.ImageCollection([
+        CreateMosaicFromScenes(window_start, scene_ids, bounding_box)
+        for window_start, scene_ids in windows
+    ])
+
+    # a timeframe is only reduced when at least one feature has no cached report for its endpoints
+    cached_reports = {}
+    for batch_key, evaluated_feature in evaluated_features.items():
+        for timeframe_name, timeframe_windows in endpoint_windows.items():
+            key = report_cache.key(
+                evaluated_feature["aoi"], timeframe_name, timeframe_windows, batched=True, tiles_per_side=tiles_per_side)
+            cached_reports[batch_key, timeframe_name] = (key, report_cache.get(key))
+    endpoint_windows = {
+        timeframe_name: timeframe_windows for timeframe_name, timeframe_windows in endpoint_windows.items()
+        if any(cached_reports[batch_key, timeframe_name][1] is None for batch_key in evaluated_features.keys())
+    }
+
+    # the per-feature statistics come from reduceRegions, so the endpoints only need their threshold band
+    endpoint_images = _EndpointImages(
+        endpoint_windows, geometry_feature, lambda window_start, scene_ids: {}, clip_geometry=bounding_box)
+    stats_imgs = {}
+    growth_decline_imgs = {}
+    for timeframe_name, timeframe_windows in endpoint_windows.items():
+        ndvi_img_start, ndvi_img_end = (
+            endpoint_images[_EndpointKey(window_start, scene_ids)]
+            for window_start, scene_ids in timeframe_windows
+        )
+        stats_imgs[timeframe_name], growth_decline_imgs[timeframe_name] = _ReportStatsImage(ndvi_img_start, ndvi_img_end)
+
+    print(f"Generating reports for {len(evaluated_features)} features, {len(endpoint_windows)} timeframes in one batch")
+    if not stats_imgs:
+        batch_rows = {}
+    elif tiles_per_side:
+        batch_rows = TiledBatchRows(stats_imgs, reduction_geo_data, geometry_feature, executor, tiles_per_side)
+    else:
+        # endpoints from the scene catalog pin their scene ids, so the graph fully determines the result
+        batch_rows = cache.get_info_many({
+            timeframe_name: _BatchRows(stats_img, geometry_feature)
+            for timeframe_name, stats_img in stats_imgs.items()
+        })
+
+    for timeframe_name in get_py_timeframes().keys():
+        sums = _BatchSums(batch_rows.get(timeframe_name, []))
+        for batch_key, evaluated_feature in evaluated_features.items():
+            name = evaluated_feature["feature"]["name"]
+            screenshot_save_name = evaluated_feature["screenshot_save_names"][timeframe_name]
+            key, cached = cached_reports[batch_key, timeframe_name]
+            if cached is not None:
+                evaluated_feature["reports"][timeframe_name] = _CachedReport(cached, timeframe_name, screenshot_save_name)
+                continue
+            stats = _LocalStats(timeframe_name, endpoint_windows[timeframe_name], sums[batch_key])
+            # scenes that only partly cover the feature leave part of it out of the statistics
+            feature_area = (evaluated_feature["feature"].get("framing") or geo_data_framing(evaluated_feature["feature"]))["area"]
+            coverage = min(stats['project_area'], stats['project_area_end']) / feature_area if feature_area else 1
+            if coverage < min_mosaic_coverage:
+                print(f"Warning: the {timeframe_name} mosaics only cover {coverage:.1%} of {name}")
+            evaluated_feature["reports"][timeframe_name] = {
+                "report": _CompileReport(stats, screenshot_save_name, name),
+                # the map of a feature only shows its own change
+                "growth_decline_img": growth_decline_imgs[timeframe_name].clip(ee.FeatureCollection(evaluated_feature["feature"])),
+                "stats": stats,
+                "report_cache_key": key,
+            }
+
+    for evaluated_feature in evaluated_features.values():
+        evaluated_feature["collection"] = collection
+    return list(evaluated_features.values()) + fallback_evaluations
+
+
 def Run(
     geojson_path,
     screenshot_save_name_base,
@@ -644,43 +1677,178 @@ def Run(
     output_folder,
     logo,
     local_test_run,
-    email_test_run
+    email_test_run,
+    executor=None,
+    batched=False,
+    tiles_per_side=None,
+    histogram=False,
+    local_stats=False,
+    approximate=False
 ):
+    # batched evaluates all features of the geojson with one reduceRegions per timeframe instead of one pipeline each,
+    # tiles_per_side splits the reductions, batched or per feature, into a grid of tiles for very large AOIs such as RUH,
+    # histogram adds the vegetation cover at every report_thresholds value from one NDVI histogram per mosaic,
+    # local_stats computes the statistics of each feature locally from its cached endpoint pixels,
+    # approximate estimates them from a stratified sample of pixels with confidence intervals
+    if histogram and (batched or tiles_per_side):
+        raise ValueError('histogram statistics are reduced per feature, they cannot be batched or tiled')
+    if local_stats and (batched or tiles_per_side or histogram):
+        raise ValueError('local statistics are computed per feature, they cannot be batched, tiled or histograms')
+    if approximate and (batched or tiles_per_side or histogram or local_stats):
+        raise ValueError('approximate statistics are sampled per feature, they cannot be combined with another mode')
     with open(geojson_path, "r") as f:
         geo_data = json.load(f)
 
     folium.Map.add_ee_layer = add_ee_layer
+    # the executor can be shared between projects so they draw from the same quota
+    executor = executor or EEExecutor()
+    cache = EECache(evaluate=lambda ee_objects: executor.evaluate(ee.Dictionary(ee_objects)))
+    report_cache = ReportCache()
+    pixel_cache = PixelCache(fetcher=EEPixelFetcher(executor)) if local_stats else None
+
+    geo_data_arr = _SplitFeatures(geo_data, framings=load_feature_framings(geojson_path, geo_data))
+
+    if batched:
+        batch_features = [
+            {"feature": feature, "screenshot_save_name_base": screenshot_save_name_base, "output_folder": output_folder}
+            for feature in geo_data_arr
+        ]
+        evaluations = [executor.submit(
+            _EvaluateBatch, batch_features, Path(geojson_path).stem, email_test_run, executor, cache, report_cache,
+            tiles_per_side)]
+    else:
+        # the features are independent, so their earth engine work runs concurrently
+        evaluations = [
+            executor.submit(
+                _EvaluateFeature, feature, screenshot_save_name_base, output_folder, email_test_run,
+                executor, cache, report_cache, tiles_per_side, histogram, pixel_cache, approximate)
+            for feature in geo_data_arr
+        ]
 
-    ### calculate NDVI
-    n_months, _ = get_timeframes()
-    dates = ee.List.sequence(0, n_months, days_in_interval)
-    dates = dates.map(lambda x: ee.Date(py_date.replace(year=2016, month=7, day=1)).advance(x, 'days'))
-
-    geo_data_arr = [
-        {
-            "type": geo_data["type"],
-            "crs": geo_data["crs"],
-            "features": [i],
-            "name": i["properties"]["REF_CL_CAT"]
-        }
-        for i in geo_data["features"]
-    ]
-        
     ### maps and report
-    for feature in geo_data_arr:
-        geometry_feature = ee.FeatureCollection(feature)
-        collection = ee.ImageCollection(dates.map(lambda x: CreateMosaic(x, geometry_feature)))
-        snake_case_name = feature["name"].lower().replace(' ', '_')
-        json_file_name = f"{snake_case_name}.json"
+    # selenium, the map html and the pdf writer share files, so this part stays sequential
+    evaluated_features = []
+    for evaluation in evaluations:
+        evaluated = evaluation.result()
+        evaluated_features.extend(evaluated if batched else [evaluated])
+    for evaluated_feature in evaluated_features:
+        if evaluated_feature is None:
+            continue
         ProcessFeature(
-            collection=collection,
-            geo_data=feature,
-            json_file_name=json_file_name,
-            screenshot_save_name_base=f"{snake_case_name}_{screenshot_save_name_base}",
+            collection=evaluated_feature["collection"],
+            geo_data=evaluated_feature["feature"],
+            json_file_name=evaluated_feature["json_file_name"],
+            screenshot_save_name_base=evaluated_feature["screenshot_save_name_base"],
             credentials_path=credentials_path,
             report_html=report_html,
             output_folder=output_folder,
             logo=logo,
             local_test_run=local_test_run,
-            email_test_run=email_test_run
+            email_test_run=email_test_run,
+            reports=evaluated_feature["reports"],
+            report_cache=report_cache
+        )
+    print(f'ee cache: {cache.hits} hits, {cache.misses} misses')
+
+
+def RunProjects(projects, local_test_run, email_test_run, executor=None):
+    # every project is evaluated as one batch of its features, projects that opt in with the same 'BATCH' name
+    # and whose areas contain or overlap each other are evaluated together, so their mosaics and threshold images
+    # are built once for the shared area
+    # 'NAME' names the features without REF_CL_CAT, by default they take the name of the geojson
+    # optional project keys pick the evaluation mode:
+    # 'TILES_PER_SIDE': n reduces in n x n tiles, a batch is tiled as finely as its most finely tiled project,
+    # 'BATCHED': False evaluates every feature with its own pipeline and stored mosaic statistics,
+    # 'HISTOGRAM': True adds the report_thresholds and 'LOCAL_STATS': True computes the statistics locally from
+    # the cached endpoint pixels, 'APPROXIMATE': True estimates them from a stratified sample,
+    # these are evaluated per feature as well
+    for project in projects:
+        if project.get('HISTOGRAM') and project.get('TILES_PER_SIDE'):
+            raise ValueError(f"{project['GEOJSON_PATH']}: histogram statistics are reduced per feature, they cannot be tiled")
+        if project.get('LOCAL_STATS') and (project.get('TILES_PER_SIDE') or project.get('HISTOGRAM')):
+            raise ValueError(f"{project['GEOJSON_PATH']}: local statistics cannot be tiled or histograms")
+        if project.get('APPROXIMATE') and (project.get('TILES_PER_SIDE') or project.get('HISTOGRAM') or project.get('LOCAL_STATS')):
+            raise ValueError(f"{project['GEOJSON_PATH']}: approximate statistics cannot be combined with another mode")
+    folium.Map.add_ee_layer = add_ee_layer
+    executor = executor or EEExecutor()
+    cache = EECache(evaluate=lambda ee_objects: executor.evaluate(ee.Dictionary(ee_objects)))
+    report_cache = ReportCache()
+    pixel_cache = (
+        PixelCache(fetcher=EEPixelFetcher(executor))
+        if any(project.get('LOCAL_STATS') for project in projects) else None
+    )
+
+    project_geo_data = []
+    for project in projects:
+        with open(project['GEOJSON_PATH'], "r") as f:
+            project_geo_data.append(json.load(f))
+
+    project_features = [
+        [
+            {
+                "feature": feature,
+                "screenshot_save_name_base": project['SCREENSHOT_SAVE_NAME'],
+                "output_folder": project['OUTPUT_FOLDER'],
+                "project": project,
+            }
+            for feature in _SplitFeatures(
+                geo_data, project.get('NAME'), load_feature_framings(project['GEOJSON_PATH'], geo_data))
+        ]
+        for project, geo_data in zip(projects, project_geo_data)
+    ]
+    batched = [
+        index for index, project in enumerate(projects)
+        if project.get('BATCHED', True)
+        and not project.get('HISTOGRAM') and not project.get('LOCAL_STATS') and not project.get('APPROXIMATE')
+    ]
+
+    evaluations = []
+    for index, project in enumerate(projects):
+        if index in batched:
+            continue
+        # the features are independent, so their earth engine work runs concurrently
+        for batch_feature in project_features[index]:
+            evaluations.append(executor.submit(
+                _EvaluateFeatures, [batch_feature], email_test_run, executor, cache, report_cache,
+                project.get('TILES_PER_SIDE'), project.get('HISTOGRAM', False),
+                pixel_cache if project.get('LOCAL_STATS') else None, project.get('APPROXIMATE', False)))
+    groups = []
+    shared_batches = {}
+    for index in batched:
+        if projects[index].get('BATCH'):
+            shared_batches.setdefault(projects[index]['BATCH'], []).append(index)
+        else:
+            groups.append([index])
+    for shared in shared_batches.values():
+        groups.extend(
+            [shared[index] for index in group]
+            for group in GroupOverlappingProjects([project_geo_data[index] for index in shared])
         )
+    for group in groups:
+        batch_features = [batch_feature for index in group for batch_feature in project_features[index]]
+        batch_name = '_'.join(Path(projects[index]['GEOJSON_PATH']).stem for index in group)
+        print(f"Evaluating {batch_name} as one batch")
+        tiles_per_side = max(projects[index].get('TILES_PER_SIDE') or 0 for index in group) or None
+        evaluations.append(executor.submit(
+            _EvaluateBatch, batch_features, batch_name, email_test_run, executor, cache, report_cache, tiles_per_side))
+
+    ### maps and report
+    # selenium, the map html and the pdf writer share files, so this part stays sequential
+    for evaluation in evaluations:
+        for evaluated_feature in evaluation.result():
+            project = evaluated_feature["project"]
+            ProcessFeature(
+                collection=evaluated_feature["collection"],
+                geo_data=evaluated_feature["feature"],
+                json_file_name=evaluated_feature["json_file_name"],
+                screenshot_save_name_base=evaluated_feature["screenshot_save_name_base"],
+                credentials_path=project.get('CREDENTIALS_PATH'),
+                report_html=project['REPORT_HTML'],
+                output_folder=project['OUTPUT_FOLDER'],
+                logo=project['LOGO'],
+                local_test_run=local_test_run,
+                email_test_run=email_test_run,
+                reports=evaluated_feature["reports"],
+                report_cache=report_cache
+            )
+    print(f'ee cache: {cache.hits} hits, {cache.misses} misses')
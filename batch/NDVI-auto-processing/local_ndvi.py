@@ -0,0 +1,86 @@
+# -*- coding: UTF-8 -*-
+# local NDVI and change statistics on B4/B8 arrays, numerically compatible with add_NDVI and _ReportStatsImage
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from definitions import *
+
+
+def ndvi(b4, b8):
+    # normalizedDifference(['B8', 'B4']): float32, masked (NaN) for masked or negative inputs, 0 where both are 0
+    b4 = np.asarray(b4, dtype=np.float32)
+    b8 = np.asarray(b8, dtype=np.float32)
+    total = b8 + b4
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(total == 0, np.float32(0), (b8 - b4) / total)
+    return np.where((b4 < 0) | (b8 < 0) | np.isnan(total), np.float32(np.nan), values).astype(np.float32)
+
+
+def threshold(ndvi_values, ndvi_threshold=ndvi_threshold):
+    # the thres band of add_NDVI and its mask, the float32 values are compared against the threshold as doubles
+    valid = ~np.isnan(ndvi_values)
+    return valid & (ndvi_values.astype(np.float64) >= ndvi_threshold), valid
+
+
+def _pixel_area(pixel_area, rows):
+    # scalar area or the rows of a per-pixel area array (like ee.Image.pixelArea)
+    return pixel_area if np.isscalar(pixel_area) else pixel_area[rows]
+
+
+def _mosaic_sums(b4, b8, aoi_mask, pixel_area, rows):
+    thres, valid = threshold(ndvi(b4[rows], b8[rows]))
+    valid &= aoi_mask[rows]
+    area = _pixel_area(pixel_area, rows)
+    return {
+        'ndvi02_area': float(np.sum((thres & valid) * area, dtype=np.float64)),
+        'area': float(np.sum(valid * area, dtype=np.float64)),
+    }
+
+
+def _comparison_sums(start, end, aoi_mask, pixel_area, rows):
+    thres_start, valid_start = threshold(ndvi(start[0][rows], start[1][rows]))
+    thres_end, valid_end = threshold(ndvi(end[0][rows], end[1][rows]))
+    valid_start &= aoi_mask[rows]
+    valid_end &= aoi_mask[rows]
+    # the difference of the thres bands only exists where both endpoints are unmasked
+    both = valid_start & valid_end
+    area = _pixel_area(pixel_area, rows)
+    return {
+        'vegetation_start': float(np.sum((thres_start & valid_start) * area, dtype=np.float64)),
+        'project_area': float(np.sum(valid_start * area, dtype=np.float64)),
+        'vegetation_end': float(np.sum((thres_end & valid_end) * area, dtype=np.float64)),
+        'project_area_end': float(np.sum(valid_end * area, dtype=np.float64)),
+        # pixel counts like the gain reduction, _LocalStats turns them into m²
+        'vegetation_gain': int(np.count_nonzero(both & ~thres_start & thres_end)),
+        'vegetation_loss': int(np.count_nonzero(both & thres_start & ~thres_end)),
+    }
+
+
+def _chunked(fn, shape, chunk_rows, max_workers):
+    # row chunks are summed on a thread pool, numpy releases the GIL inside the array operations
+    chunks = [slice(row, min(row + chunk_rows, shape[0])) for row in range(0, shape[0], chunk_rows)]
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        partial_sums = list(pool.map(fn, chunks))
+    return {key: sum(sums[key] for sums in partial_sums) for key in partial_sums[0].keys()}
+
+
+def mosaic_stats(b4, b8, aoi_mask, pixel_area=stats_scale ** 2, chunk_rows=1024, max_workers=None):
+    # the ndvi02_area and area properties add_NDVI sets on a mosaic, the mask of B4/B8 stands in for B1
+    return _chunked(
+        lambda rows: _mosaic_sums(b4, b8, aoi_mask, pixel_area, rows),
+        aoi_mask.shape, chunk_rows, max_workers)
+
+
+def comparison_stats(start, end, aoi_mask, pixel_area=stats_scale ** 2, chunk_rows=1024, max_workers=None):
+    # band sums of _ReportStatsImage for the (b4, b8) arrays of two dates, ready for _LocalStats
+    return _chunked(
+        lambda rows: _comparison_sums(start, end, aoi_mask, pixel_area, rows),
+        aoi_mask.shape, chunk_rows, max_workers)
+
+
+def growth_decline(start, end):
+    # the growth_decline_img of _ReportImages: 1 for gain, -1 for loss, NaN where unchanged or masked
+    thres_start, valid_start = threshold(ndvi(*start))
+    thres_end, valid_end = threshold(ndvi(*end))
+    change = thres_end.astype(np.float32) - thres_start.astype(np.float32)
+    return np.where(valid_start & valid_end & (change != 0), change, np.float32(np.nan))
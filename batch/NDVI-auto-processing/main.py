@@ -7,6 +7,7 @@ from send_email import *
 import sys
 from definitions import *
 import lib_ndvi 
+from ee_executor import EEExecutor
 
 
 def init_ee(email, credentials_file):
@@ -53,18 +54,22 @@ def main():
             'CREDENTIALS_PATH': 'credentials/credentials.json',
             'OUTPUT_FOLDER': 'output'
         }
+        # RUH and RUH_CL are reported by their own scripts in RUH/ and RUH_CL/, which keep their report history,
+        # so they are not listed here
+        # optional per project: 'BATCH': name evaluates overlapping projects with the same name together,
+        # 'TILES_PER_SIDE': n tiles the reductions, 'BATCHED': False, 'HISTOGRAM': True, 'LOCAL_STATS': True or
+        # 'APPROXIMATE': True evaluate the project per feature
     ]
-    for i in projects:
-        lib_ndvi.Run(
-            geojson_path=i['GEOJSON_PATH'], 
-            screenshot_save_name_base=i['SCREENSHOT_SAVE_NAME'],
-            credentials_path=i.get('CREDENTIALS_PATH'),
-            report_html=i['REPORT_HTML'],
-            output_folder=i['OUTPUT_FOLDER'],
-            logo=i['LOGO'],
-            local_test_run=local_test_run,
-            email_test_run=email_test_run
-        )
+    # one executor for all projects, so they share the earth engine quota
+    executor = EEExecutor()
+    # every project is reduced with one reduceRegions per timeframe, projects in a shared batch share their mosaics
+    lib_ndvi.RunProjects(
+        projects,
+        local_test_run=local_test_run,
+        email_test_run=email_test_run,
+        executor=executor
+    )
+    executor.shutdown()
 
 if __name__ == "__main__":
     main()
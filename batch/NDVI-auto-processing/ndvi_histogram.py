@@ -0,0 +1,77 @@
+# -*- coding: UTF-8 -*-
+# vegetation area at any threshold from the area-weighted NDVI histograms of add_NDVI, computed locally
+import json
+from definitions import *
+
+# a histogram is sparse, {bin: area in m²} for the bins with any area, bin k holds the pixels with NDVI in
+# [k, k + 1) / bins and NDVI 1 is counted in the last bin, bin -bins - 1 holds the pixels of the AOI without NDVI,
+# they count in the area but never as vegetation
+# in json the bins are strings, every function here accepts both
+
+
+def no_ndvi_bin(bins=ndvi_histogram_bins):
+    return -bins - 1
+
+
+def histogram_from_groups(groups):
+    # the histogram from the groups of the grouped reduction, [{'bin': k, 'sum': area}, ...]
+    histogram = {}
+    for group in groups:
+        if group['sum']:
+            histogram[int(group['bin'])] = histogram.get(int(group['bin']), 0) + group['sum']
+    return dict(sorted(histogram.items()))
+
+
+def histogram_groups(histogram):
+    # back to the grouped form, for mosaics whose histogram is attached from the stats store
+    return [{'bin': int(k), 'sum': area} for k, area in histogram.items()]
+
+
+def threshold_bin(threshold, bins=ndvi_histogram_bins):
+    k = round(threshold * bins)
+    if abs(threshold * bins - k) > 1e-9 or not -bins <= k <= bins:
+        raise ValueError(f'Threshold {threshold} is not a bin edge of a histogram with {bins} bins per NDVI unit')
+    return k
+
+
+def histogram_area(histogram):
+    return sum(histogram.values())
+
+
+def vegetation_area(histogram, threshold=ndvi_threshold, bins=ndvi_histogram_bins):
+    # area with NDVI >= threshold
+    k = threshold_bin(threshold, bins)
+    return sum(area for bin_key, area in histogram.items() if int(bin_key) >= k)
+
+
+def threshold_stats(histogram_start, histogram_end, thresholds=report_thresholds, bins=ndvi_histogram_bins):
+    # vegetation area and share at the start and end of a timeframe for each threshold
+    project_area = histogram_area(histogram_start)
+    project_area_end = histogram_area(histogram_end)
+    stats = {}
+    for threshold in thresholds:
+        vegetation_start = vegetation_area(histogram_start, threshold, bins)
+        vegetation_end = vegetation_area(histogram_end, threshold, bins)
+        stats[str(threshold)] = {
+            'vegetation_start': vegetation_start,
+            'vegetation_end': vegetation_end,
+            'vegetation_share_start': vegetation_start / project_area * 100 if project_area else 0,
+            'vegetation_share_end': vegetation_end / project_area_end * 100 if project_area_end else 0,
+            'area_change': vegetation_end - vegetation_start,
+        }
+    return stats
+
+
+def history_threshold_stats(json_file_name, thresholds=report_thresholds, bins=ndvi_histogram_bins):
+    # threshold_stats of every report in the project history that has histograms, no earth engine request
+    with open(json_file_name, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {
+        date: {
+            timeframe_name: threshold_stats(
+                report['ndvi_histogram_start'], report['ndvi_histogram_end'], thresholds, bins)
+            for timeframe_name, report in reports.items()
+            if 'ndvi_histogram_start' in report
+        }
+        for date, reports in data.items()
+    }
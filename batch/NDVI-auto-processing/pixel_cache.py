@@ -0,0 +1,200 @@
+# -*- coding: UTF-8 -*-
+# on-disk cache of the clipped mosaic bands of a window, downloaded once and then read locally
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from definitions import *
+from geometry import raster_grid, rasterize
+from stats_store import aoi_hash, scenes_hash
+
+
+def _tile_transform(transform, rows, columns):
+    x0, y0, dx, dy = transform
+    return x0 + columns.start * dx, y0 - rows.start * dy, dx, dy
+
+
+class EEPixelFetcher:
+    # production fetcher: ee.data.computePixels of the clipped mosaic, masked pixels as nodata
+
+    def __init__(self, executor=None):
+        # imported here so the cache and the local fetcher work without an earth engine session
+        import ee
+        import lib_ndvi
+        self.ee = ee
+        self.lib_ndvi = lib_ndvi
+        self.executor = executor
+
+    def __call__(self, window_start, scene_ids, geo_data, bands, transform, rows, columns, nodata):
+        mosaic = self.lib_ndvi.CreateMosaicFromScenes(window_start, scene_ids, self.ee.FeatureCollection(geo_data))
+        x0, y0, dx, dy = _tile_transform(transform, rows, columns)
+        request = {
+            'expression': mosaic.select(list(bands)).unmask(nodata).toUint16(),
+            'fileFormat': 'NUMPY_NDARRAY',
+            'bandIds': list(bands),
+            'grid': {
+                'dimensions': {'width': columns.stop - columns.start, 'height': rows.stop - rows.start},
+                'affineTransform': {
+                    'scaleX': dx, 'shearX': 0, 'translateX': x0,
+                    'shearY': 0, 'scaleY': -dy, 'translateY': y0,
+                },
+                'crsCode': 'EPSG:4326',
+            },
+        }
+        if self.executor is not None:
+            pixels = self.executor.call(self.ee.data.computePixels, request)
+        else:
+            pixels = self.ee.data.computePixels(request)
+        return {band: np.asarray(pixels[band], dtype=np.uint16) for band in bands}
+
+
+class ArrayFetcher:
+    # local stand-in for EEPixelFetcher, serves tiles of band arrays already on the cache grid
+    # mosaics maps get_millis(window_start) to {band: uint16 array}
+
+    def __init__(self, mosaics):
+        self.mosaics = mosaics
+        self.requests = 0
+
+    def __call__(self, window_start, scene_ids, geo_data, bands, transform, rows, columns, nodata):
+        self.requests += 1
+        mosaic = self.mosaics[get_millis(window_start)]
+        return {band: np.asarray(mosaic[band][rows, columns], dtype=np.uint16) for band in bands}
+
+
+class PixelCache:
+    # one entry per (scene ids, AOI, scale, bands): tiles are written as they arrive, so an interrupted fetch
+    # resumes with the missing tiles, and complete entries are evicted least recently used first
+
+    def __init__(
+        self,
+        path='pixel_cache',
+        fetcher=None,
+        max_bytes=8 * 1024 ** 3,
+        tile_shape=(512, 512),
+        max_workers=4,
+        nodata=65535
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.fetcher = fetcher or EEPixelFetcher()
+        self.max_bytes = max_bytes
+        self.tile_shape = tile_shape
+        self.max_workers = max_workers
+        self.nodata = nodata
+
+    def key(self, aoi, scene_ids, scale, bands):
+        return hashlib.sha256(json.dumps([aoi, scenes_hash(scene_ids), scale, list(bands)]).encode('utf-8')).hexdigest()
+
+    def _tiles(self, shape):
+        tile_height, tile_width = self.tile_shape
+        return [
+            (slice(top, min(top + tile_height, shape[0])), slice(left, min(left + tile_width, shape[1])))
+            for top in range(0, shape[0], tile_height)
+            for left in range(0, shape[1], tile_width)
+        ]
+
+    def _fetch_tile(self, entry, tile_path, window_start, scene_ids, geo_data, meta, rows, columns):
+        pixels = self.fetcher(
+            window_start, scene_ids, geo_data, meta['bands'], meta['transform'], rows, columns, self.nodata)
+        # written under a temporary name, so a tile file is always complete
+        tmp_path = entry / f'{tile_path.stem}.tmp.npz'
+        np.savez(tmp_path, **pixels)
+        tmp_path.replace(tile_path)
+
+    def _download(self, entry, window_start, scene_ids, geo_data, meta):
+        tiles = self._tiles(meta['shape'])
+        aoi_mask = rasterize(geo_data, meta['transform'], meta['shape'])
+        pending = []
+        for rows, columns in tiles:
+            tile_path = entry / f'tile_{rows.start}_{columns.start}.npz'
+            # tiles already on disk from an interrupted run and tiles outside the AOI are not requested
+            if tile_path.exists() or not aoi_mask[rows, columns].any():
+                continue
+            pending.append((tile_path, rows, columns))
+        print(f'Fetching {len(pending)} of {len(tiles)} tiles of {window_start:%d.%m.%Y}')
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [
+                pool.submit(self._fetch_tile, entry, tile_path, window_start, scene_ids, geo_data, meta, rows, columns)
+                for tile_path, rows, columns in pending
+            ]
+            errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            # the finished tiles stay on disk for the next attempt
+            raise errors[0]
+
+        for band in meta['bands']:
+            array = np.lib.format.open_memmap(
+                entry / f'{band}.npy', mode='w+', dtype=np.uint16, shape=tuple(meta['shape']))
+            array[:] = self.nodata
+            for rows, columns in tiles:
+                tile_path = entry / f'tile_{rows.start}_{columns.start}.npz'
+                if tile_path.exists():
+                    with np.load(tile_path) as tile:
+                        array[rows, columns] = tile[band]
+            array.flush()
+            del array
+        meta['complete'] = True
+        self._write_meta(entry, meta)
+        for tile_path in entry.glob('tile_*.npz'):
+            tile_path.unlink()
+
+    def _write_meta(self, entry, meta):
+        tmp_path = entry / 'meta.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=4)
+        tmp_path.replace(entry / 'meta.json')
+
+    def read(self, window_start, scene_ids, geo_data, scale=stats_scale, bands=('B4', 'B8')):
+        # float32 band arrays (nodata as NaN, like RasterCube.read) and the grid transform of the mosaic
+        entry = self.path / self.key(aoi_hash(geo_data), scene_ids, scale, bands)
+        meta_path = entry / 'meta.json'
+        if meta_path.exists():
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        else:
+            entry.mkdir(parents=True, exist_ok=True)
+            transform, shape = raster_grid(geo_data, scale)
+            meta = {
+                'window_start': get_millis(window_start),
+                'scene_ids': sorted(scene_ids),
+                'scale': scale,
+                'bands': list(bands),
+                'transform': list(transform),
+                'shape': list(shape),
+                'complete': False,
+            }
+            self._write_meta(entry, meta)
+        if not meta['complete']:
+            self._download(entry, window_start, scene_ids, geo_data, meta)
+            self.evict(keep=entry)
+        # the modification time of meta.json is the last use for the eviction
+        os.utime(meta_path)
+
+        band_arrays = {}
+        for band in bands:
+            array = np.load(entry / f'{band}.npy').astype(np.float32)
+            array[array == self.nodata] = np.nan
+            band_arrays[band] = array
+        return band_arrays, tuple(meta['transform'])
+
+    def _entry_bytes(self, entry):
+        return sum(path.stat().st_size for path in entry.iterdir() if path.is_file())
+
+    def evict(self, keep=None):
+        # removes the least recently used entries until the cache fits in max_bytes
+        entries = [entry for entry in self.path.iterdir() if (entry / 'meta.json').exists()]
+        sizes = {entry: self._entry_bytes(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in sorted(entries, key=lambda entry: (entry / 'meta.json').stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and entry == keep:
+                continue
+            logging.debug(f'Evicting {entry.name} ({sizes[entry] / 1024 ** 2:.1f} MB) from the pixel cache')
+            shutil.rmtree(entry)
+            total -= sizes[entry]
@@ -0,0 +1,143 @@
+# -*- coding: UTF-8 -*-
+# per-AOI (time, y, x) cube of the mosaic bands on disk, for comparisons without a server reduction
+# GenerateLocalReports keeps the endpoint mosaics of every AOI here, the pixel cache only downloads them
+import json
+import zlib
+from pathlib import Path
+import numpy as np
+from definitions import *
+
+# one cube per AOI under this folder, named by stats_store.aoi_hash
+raster_cube_path = 'raster_cube'
+
+
+class RasterCube:
+    # compressed chunks are appended to one data file and read back through a memory map, so a comparison
+    # of two dates only touches their chunks and appending a window never rewrites existing data
+
+    def __init__(
+        self,
+        path,
+        shape=None,
+        transform=None,
+        bands=('B4', 'B8'),
+        chunk_shape=(512, 512),
+        dtype='uint16',
+        nodata=65535
+    ):
+        self.path = Path(path)
+        self.meta_path = self.path / 'cube.json'
+        self.data_path = self.path / 'chunks.bin'
+        if self.meta_path.exists():
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+            return
+        if shape is None or transform is None:
+            raise ValueError(f'{self.path} is no raster cube yet, shape and transform are needed to create it')
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.data_path.touch()
+        # transform as in geometry.rasterize, bands can include QA60 for maskS2clouds
+        self.meta = {
+            'shape': list(shape),
+            'transform': list(transform),
+            'bands': list(bands),
+            'chunk_shape': list(chunk_shape),
+            'dtype': dtype,
+            'nodata': nodata,
+            'windows': [],
+            'scene_ids': {},
+        }
+        self._write_meta()
+
+    def _write_meta(self):
+        # the metadata is small, a temporary file keeps it readable if the run stops halfway
+        tmp_path = self.meta_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=4)
+        tmp_path.replace(self.meta_path)
+
+    @property
+    def shape(self):
+        return tuple(self.meta['shape'])
+
+    @property
+    def chunk_shape(self):
+        return tuple(self.meta['chunk_shape'])
+
+    def _chunk_grid(self):
+        return tuple(-(-size // chunk) for size, chunk in zip(self.shape, self.chunk_shape))
+
+    def _index_path(self, window_start):
+        return self.path / f'window_{get_millis(window_start)}.npy'
+
+    def windows(self):
+        return [datetime.utcfromtimestamp(millis / 1000) for millis in sorted(self.meta['windows'])]
+
+    def has(self, window_start, scene_ids=None):
+        # whether the window is in the cube, with scene_ids only if its mosaic was made of these scenes
+        millis = get_millis(window_start)
+        if millis not in self.meta['windows']:
+            return False
+        return scene_ids is None or self.meta.get('scene_ids', {}).get(str(millis)) == sorted(scene_ids)
+
+    def append(self, window_start, band_arrays, scene_ids=None):
+        # band_arrays maps every band of the cube to a 2D array of the cube shape, masked pixels as nodata or NaN
+        # a window already in the cube is only taken again with other scene_ids (a late scene), its new chunks
+        # are appended and its index replaced, the old chunks stay unused in the data file
+        millis = get_millis(window_start)
+        if millis in self.meta['windows'] and (scene_ids is None or self.has(window_start, scene_ids)):
+            raise ValueError(f'Window {window_start:%d.%m.%Y} is already in {self.path}')
+        chunk_rows, chunk_columns = self._chunk_grid()
+        # (band, chunk row, chunk column) -> (offset, length) in the data file
+        index = np.zeros((len(self.meta['bands']), chunk_rows, chunk_columns, 2), dtype=np.int64)
+        with open(self.data_path, 'ab') as f:
+            offset = f.tell()
+            for b, band in enumerate(self.meta['bands']):
+                array = np.asarray(band_arrays[band])
+                if np.issubdtype(array.dtype, np.floating):
+                    array = np.where(np.isnan(array), self.meta['nodata'], array)
+                array = array.astype(self.meta['dtype'])
+                if array.shape != self.shape:
+                    raise ValueError(f'{band} has shape {array.shape}, the cube has {self.shape}')
+                for i in range(chunk_rows):
+                    for j in range(chunk_columns):
+                        chunk = array[
+                            i * self.chunk_shape[0]:(i + 1) * self.chunk_shape[0],
+                            j * self.chunk_shape[1]:(j + 1) * self.chunk_shape[1]]
+                        compressed = zlib.compress(np.ascontiguousarray(chunk).tobytes(), 6)
+                        f.write(compressed)
+                        index[b, i, j] = (offset, len(compressed))
+                        offset += len(compressed)
+        np.save(self._index_path(window_start), index)
+        # the window only becomes visible once its chunks and index are written
+        if millis not in self.meta['windows']:
+            self.meta['windows'].append(millis)
+        if scene_ids is not None:
+            self.meta.setdefault('scene_ids', {})[str(millis)] = sorted(scene_ids)
+        self._write_meta()
+
+    def read(self, window_start, band, rows=slice(None), columns=slice(None)):
+        # float32 pixels of one band, nodata as NaN, only the chunks overlapping rows x columns are decompressed
+        if get_millis(window_start) not in self.meta['windows']:
+            raise KeyError(f'Window {window_start:%d.%m.%Y} is not in {self.path}')
+        row_start, row_stop, _ = rows.indices(self.shape[0])
+        column_start, column_stop, _ = columns.indices(self.shape[1])
+        index = np.load(self._index_path(window_start), mmap_mode='r')[self.meta['bands'].index(band)]
+        data = np.memmap(self.data_path, dtype=np.uint8, mode='r')
+        out = np.empty((row_stop - row_start, column_stop - column_start), dtype=np.float32)
+        chunk_height, chunk_width = self.chunk_shape
+        for i in range(row_start // chunk_height, -(-row_stop // chunk_height)):
+            for j in range(column_start // chunk_width, -(-column_stop // chunk_width)):
+                offset, length = index[i, j]
+                top, left = i * chunk_height, j * chunk_width
+                height = min(chunk_height, self.shape[0] - top)
+                width = min(chunk_width, self.shape[1] - left)
+                chunk = np.frombuffer(zlib.decompress(data[offset:offset + length]), dtype=self.meta['dtype'])
+                chunk = chunk.reshape(height, width)
+                # overlap of the chunk with the requested window, in cube coordinates
+                r0, r1 = max(top, row_start), min(top + height, row_stop)
+                c0, c1 = max(left, column_start), min(left + width, column_stop)
+                out[r0 - row_start:r1 - row_start, c0 - column_start:c1 - column_start] = \
+                    chunk[r0 - top:r1 - top, c0 - left:c1 - left]
+        out[out == self.meta['nodata']] = np.nan
+        return out
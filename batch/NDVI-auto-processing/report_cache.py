@@ -0,0 +1,50 @@
+# -*- coding: UTF-8 -*-
+# cache of finished timeframe reports and their map, keyed by the endpoint mosaics they compare
+import hashlib
+import json
+from pathlib import Path
+from shutil import copy
+from definitions import *
+from stats_store import scenes_hash
+
+
+class ReportCache:
+    # a timeframe is only computed again when one of its endpoint mosaics changes
+
+    def __init__(self, path='report_cache'):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def key(
+        self, aoi, timeframe_name, endpoint_windows,
+        histogram=False, batched=False, local_stats=False, tiles_per_side=None, approximate=False
+    ):
+        endpoints = [
+            [get_millis(window_start), scenes_hash(scene_ids)]
+            for window_start, scene_ids in endpoint_windows
+        ]
+        # every evaluation mode gets its own entries, e.g. reports with histograms have more fields,
+        # the keys of plain per-feature reports stay the same
+        modes = [
+            mode for mode, enabled in (
+                ('histogram', histogram), ('batched', batched), ('local_stats', local_stats), ('approximate', approximate))
+            if enabled
+        ]
+        # a tiled reduction sums its tiles, so its values can differ from the untiled one in the last digits
+        if tiles_per_side:
+            modes.append(f'tiles_per_side_{tiles_per_side}')
+        return hashlib.sha256(json.dumps([aoi, timeframe_name, endpoints] + modes).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        # the cached report and the path of its map, or None
+        report_path = self.path / f'{key}.json'
+        image_path = self.path / f'{key}.jpeg'
+        if not report_path.exists() or not image_path.exists():
+            return None
+        with open(report_path, 'r', encoding='utf-8') as f:
+            return json.load(f), image_path
+
+    def put(self, key, report, image_path):
+        copy(image_path, self.path / f'{key}.jpeg')
+        with open(self.path / f'{key}.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
@@ -0,0 +1,191 @@
+# -*- coding: UTF-8 -*-
+# local catalog of the Sentinel-2 scenes covering one AOI
+import json
+import sqlite3
+import ee
+from datetime import datetime, timedelta
+from definitions import *
+from geometry import geometries_intersect, geo_data_framing
+
+scene_collection = 'COPERNICUS/S2_HARMONIZED'
+max_cloudy_pixel_percentage = 1
+# earth engine ingests granules of a pass (other MGRS tiles, reprocessed scenes) up to a few days late,
+# so every update requests this many days before the newest known scene again
+ingestion_lookback_days = 5
+
+
+class SceneCatalog:
+    # one sqlite file per AOI, one row per scene intersecting the AOI
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS scenes (
+                id TEXT PRIMARY KEY,
+                time_start INTEGER NOT NULL,
+                cloudy_pixel_percentage REAL,
+                mgrs_tile TEXT,
+                xmin REAL,
+                ymin REAL,
+                xmax REAL,
+                ymax REAL
+            )''')
+        # the footprint (coordinates of the scene geometry as json) came after the bbox, older catalogs get the column
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(scenes)')]
+        if 'footprint' not in columns:
+            self.connection.execute('ALTER TABLE scenes ADD COLUMN footprint TEXT')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS scenes_time_start ON scenes (time_start)')
+        # scene ids (comma separated, oldest first) per closed 40-day window, so empty windows never become mosaics
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS window_scenes (
+                window_start INTEGER NOT NULL,
+                max_cloud REAL NOT NULL,
+                scene_ids TEXT NOT NULL,
+                PRIMARY KEY (window_start, max_cloud)
+            )''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def newest_time_start(self, max_cloud=None):
+        query = 'SELECT MAX(time_start) FROM scenes'
+        args = ()
+        if max_cloud is not None:
+            query += ' WHERE cloudy_pixel_percentage < ?'
+            args = (max_cloud,)
+        return self.connection.execute(query, args).fetchone()[0]
+
+    def update(self, geometry_feature, evaluate=None):
+        # only scenes from the lookback before the newest row on are requested, all in one round trip,
+        # scenes already in the catalog are ignored
+        newest = self.newest_time_start()
+        if newest is not None:
+            start = ee.Date(newest - ingestion_lookback_days * 24 * 60 * 60 * 1000)
+        else:
+            start = ee.Date(window_origin)
+        scenes = (ee.ImageCollection(scene_collection)
+            .filterDate(start, ee.Date(py_date))
+            .filterBounds(geometry_feature)
+            .map(lambda image: image.set(
+                'bbox', image.geometry().bounds().coordinates().get(0),
+                'footprint', image.geometry().coordinates())))
+        columns = ['system:index', 'system:time_start', 'CLOUDY_PIXEL_PERCENTAGE', 'MGRS_TILE', 'bbox', 'footprint']
+        rows = scenes.reduceColumns(ee.Reducer.toList(len(columns)), columns).get('list')
+        rows = evaluate(rows) if evaluate is not None else rows.getInfo()
+
+        records = []
+        for scene_id, time_start, cloudy_pixel_percentage, mgrs_tile, bbox, footprint in rows:
+            xcoords = [coord[0] for coord in bbox]
+            ycoords = [coord[1] for coord in bbox]
+            records.append((
+                scene_id, time_start, cloudy_pixel_percentage, mgrs_tile,
+                min(xcoords), min(ycoords), max(xcoords), max(ycoords), json.dumps(footprint)))
+        new_scenes = 0
+        new_windows = set()
+        for record in records:
+            if self.connection.execute('INSERT OR IGNORE INTO scenes (id, time_start, cloudy_pixel_percentage, mgrs_tile, xmin, ymin, xmax, ymax, footprint) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', record).rowcount:
+                new_scenes += 1
+                new_windows.add(get_millis(get_window_start(datetime.utcfromtimestamp(record[1] / 1000))))
+        # a late scene of an already indexed window makes that window be indexed again
+        self.connection.executemany(
+            'DELETE FROM window_scenes WHERE window_start = ?', [(window_start,) for window_start in new_windows])
+        self.connection.commit()
+        print(f'Scene catalog {self.path}: {new_scenes} new scenes')
+        return new_scenes
+
+    def scene_ids(self, start, end, max_cloud=max_cloudy_pixel_percentage):
+        # ids of the scenes acquired in [start, end), oldest first, like filterDate and the cloud filter
+        rows = self.connection.execute(
+            'SELECT id FROM scenes WHERE time_start >= ? AND time_start < ? AND cloudy_pixel_percentage < ? ORDER BY time_start, id',
+            (get_millis(start), get_millis(end), max_cloud)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def windows(self, max_cloud=max_cloudy_pixel_percentage):
+        # scenes of every 40-day mosaic window since window_origin, answered without earth engine
+        return [
+            (window_start, self.scene_ids(window_start, window_start + timedelta(days=days_in_interval), max_cloud))
+            for window_start in get_window_starts()
+        ]
+
+    def latest_scene_date(self, max_cloud=max_cloudy_pixel_percentage, scene_ids=None):
+        # scene_ids limits the probe to these scenes, e.g. the ones over one feature of a batch
+        if scene_ids is None:
+            newest = self.newest_time_start(max_cloud)
+        else:
+            newest = max((
+                time_start for scene_id, time_start in self.connection.execute(
+                    'SELECT id, time_start FROM scenes WHERE cloudy_pixel_percentage < ?', (max_cloud,))
+                if scene_id in scene_ids
+            ), default=None)
+        if newest is None:
+            return None
+        return datetime.utcfromtimestamp(newest / 1000)
+
+    def intersecting_scene_ids(self, geo_data):
+        # ids of the scenes whose footprint intersects a feature of geo_data,
+        # scenes catalogued before the footprints were kept are tested with their bbox
+        xmin, ymin, xmax, ymax = (float(value) for value in geo_data_framing(geo_data)['bbox'])
+        rows = self.connection.execute(
+            'SELECT id, footprint, xmin, ymin, xmax, ymax FROM scenes WHERE xmin <= ? AND xmax >= ? AND ymin <= ? AND ymax >= ?',
+            (xmax, xmin, ymax, ymin)
+        ).fetchall()
+        # the scenes of one MGRS tile and orbit share their footprint
+        intersects = {}
+        scene_ids = set()
+        for scene_id, footprint, scene_xmin, scene_ymin, scene_xmax, scene_ymax in rows:
+            if footprint is None:
+                footprint = json.dumps([[
+                    [scene_xmin, scene_ymin], [scene_xmax, scene_ymin], [scene_xmax, scene_ymax],
+                    [scene_xmin, scene_ymax], [scene_xmin, scene_ymin]]])
+            if footprint not in intersects:
+                coordinates = json.loads(footprint)
+                # a polygon nests three levels down to the coordinates, a multipolygon four
+                geometry_type = 'Polygon' if isinstance(coordinates[0][0][0], (int, float)) else 'MultiPolygon'
+                geometry = {'type': geometry_type, 'coordinates': coordinates}
+                intersects[footprint] = any(
+                    geometries_intersect(geometry, feature['geometry']) for feature in geo_data['features'])
+            if intersects[footprint]:
+                scene_ids.add(scene_id)
+        return scene_ids
+
+    def update_windows(self, max_cloud=max_cloudy_pixel_percentage):
+        # closed windows are indexed once, windows that closed within the ingestion lookback are indexed again
+        # on every run, since their late scenes may only have arrived now
+        recount_after = py_date - timedelta(days=ingestion_lookback_days)
+        known = {
+            row[0] for row in self.connection.execute(
+                'SELECT window_start FROM window_scenes WHERE max_cloud = ?', (max_cloud,))
+        }
+        records = []
+        for window_start in get_window_starts():
+            window_end = window_start + timedelta(days=days_in_interval)
+            if window_end > py_date or (get_millis(window_start) in known and window_end <= recount_after):
+                continue
+            scene_ids = self.scene_ids(window_start, window_end, max_cloud)
+            records.append((get_millis(window_start), max_cloud, ','.join(scene_ids)))
+        self.connection.executemany('INSERT OR REPLACE INTO window_scenes VALUES (?, ?, ?)', records)
+        self.connection.commit()
+        return len(records)
+
+    def non_empty_windows(self, max_cloud=max_cloudy_pixel_percentage, scene_ids=None):
+        # like windows(), but without the windows that have no scene under the cloud threshold,
+        # scene_ids keeps only these scenes, e.g. the ones over one feature of a batch
+        self.update_windows(max_cloud)
+        indexed = dict(self.connection.execute(
+            'SELECT window_start, scene_ids FROM window_scenes WHERE max_cloud = ?', (max_cloud,)).fetchall())
+        non_empty_windows = []
+        for window_start in get_window_starts():
+            if get_millis(window_start) in indexed:
+                window_scene_ids = indexed[get_millis(window_start)].split(',') if indexed[get_millis(window_start)] else []
+            else:
+                # the open window is not indexed and is checked against the scenes directly
+                window_scene_ids = self.scene_ids(window_start, window_start + timedelta(days=days_in_interval), max_cloud)
+            if scene_ids is not None:
+                window_scene_ids = [scene_id for scene_id in window_scene_ids if scene_id in scene_ids]
+            if window_scene_ids:
+                non_empty_windows.append((window_start, window_scene_ids))
+        return non_empty_windows
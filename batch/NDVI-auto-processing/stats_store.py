@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+# local store of the add_NDVI statistics of every mosaic, shared across timeframes and runs
+import hashlib
+import json
+import sqlite3
+from definitions import *
+
+
+def aoi_hash(geo_data):
+    # identifies the AOI by its geometry, so renaming a feature keeps its statistics
+    geometries = [feature['geometry'] for feature in geo_data['features']]
+    return hashlib.sha256(json.dumps(geometries, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def scenes_hash(scene_ids):
+    # a window that gains a scene gets a different mosaic, so its statistics are computed again
+    return hashlib.sha256(','.join(sorted(scene_ids)).encode('utf-8')).hexdigest()
+
+
+class MosaicStatsStore:
+
+    def __init__(self, path='mosaic_stats.sqlite'):
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS mosaic_stats (
+                aoi_hash TEXT NOT NULL,
+                window_start INTEGER NOT NULL,
+                threshold REAL NOT NULL,
+                scale REAL NOT NULL,
+                scenes_hash TEXT NOT NULL,
+                ndvi02_area REAL,
+                area REAL,
+                PRIMARY KEY (aoi_hash, window_start, threshold, scale)
+            )''')
+        # the NDVI histogram does not depend on the threshold, so one row serves every threshold
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS mosaic_histograms (
+                aoi_hash TEXT NOT NULL,
+                window_start INTEGER NOT NULL,
+                bins INTEGER NOT NULL,
+                scale REAL NOT NULL,
+                scenes_hash TEXT NOT NULL,
+                histogram TEXT NOT NULL,
+                PRIMARY KEY (aoi_hash, window_start, bins, scale)
+            )''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, aoi, window_start, scene_ids, threshold=ndvi_threshold, scale=stats_scale):
+        row = self.connection.execute(
+            'SELECT scenes_hash, ndvi02_area, area FROM mosaic_stats WHERE aoi_hash = ? AND window_start = ? AND threshold = ? AND scale = ?',
+            (aoi, get_millis(window_start), threshold, scale)
+        ).fetchone()
+        if row is None or row[0] != scenes_hash(scene_ids):
+            return None
+        return {'ndvi02_area': row[1], 'area': row[2]}
+
+    def put(self, aoi, window_start, scene_ids, stats, threshold=ndvi_threshold, scale=stats_scale):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO mosaic_stats VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (aoi, get_millis(window_start), threshold, scale, scenes_hash(scene_ids), stats['ndvi02_area'], stats['area'])
+        )
+        self.connection.commit()
+
+    def get_histogram(self, aoi, window_start, scene_ids, bins=ndvi_histogram_bins, scale=stats_scale):
+        row = self.connection.execute(
+            'SELECT scenes_hash, histogram FROM mosaic_histograms WHERE aoi_hash = ? AND window_start = ? AND bins = ? AND scale = ?',
+            (aoi, get_millis(window_start), bins, scale)
+        ).fetchone()
+        if row is None or row[0] != scenes_hash(scene_ids):
+            return None
+        return json.loads(row[1])
+
+    def put_histogram(self, aoi, window_start, scene_ids, histogram, bins=ndvi_histogram_bins, scale=stats_scale):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO mosaic_histograms VALUES (?, ?, ?, ?, ?, ?)',
+            (aoi, get_millis(window_start), bins, scale, scenes_hash(scene_ids), json.dumps(histogram))
+        )
+        self.connection.commit()
@@ -0,0 +1,5 @@
+# the pipeline modules are flat scripts in the folder above, imported the way main.py imports them
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,58 @@
+import json
+from datetime import datetime, timedelta
+from ee_cache import EECache
+
+
+class FakeEE:
+    # local stand-in for earth engine: an "ee object" is a dict describing a mosaic window and its scenes,
+    # evaluate records every remote call
+    def __init__(self):
+        self.calls = []
+
+    def serialize(self, ee_object):
+        return json.dumps(ee_object, sort_keys=True)
+
+    def evaluate(self, ee_objects):
+        self.calls.append(sorted(ee_objects.keys()))
+        return {name: {'ndvi02_area': len(ee_object['scene_ids']) * 100.0} for name, ee_object in ee_objects.items()}
+
+
+def window_stats(windows):
+    return {
+        window_start.strftime('%Y-%m-%d'): {'window_start': window_start.isoformat(), 'scene_ids': scene_ids}
+        for window_start, scene_ids in windows
+    }
+
+
+def closed_windows():
+    start = datetime(2016, 7, 1)
+    return [(start + timedelta(days=40 * i), [f'scene_{i}_a', f'scene_{i}_b']) for i in range(5)]
+
+
+def test_second_run_makes_no_remote_calls(tmp_path):
+    fake = FakeEE()
+    windows = closed_windows()
+    first = EECache(tmp_path, serialize=fake.serialize, evaluate=fake.evaluate).get_info_many(window_stats(windows))
+    assert len(fake.calls) == 1
+
+    # a new run opens the cache from disk
+    cache = EECache(tmp_path, serialize=fake.serialize, evaluate=fake.evaluate)
+    second = cache.get_info_many(window_stats(windows))
+    assert len(fake.calls) == 1
+    assert second == first
+    assert (cache.hits, cache.misses) == (5, 0)
+
+
+def test_changed_scene_ids_miss(tmp_path):
+    fake = FakeEE()
+    windows = closed_windows()
+    EECache(tmp_path, serialize=fake.serialize, evaluate=fake.evaluate).get_info_many(window_stats(windows))
+
+    # a late scene changes the mosaic of one window, only that window is evaluated again
+    window_start, scene_ids = windows[2]
+    windows[2] = (window_start, scene_ids + ['scene_2_late'])
+    cache = EECache(tmp_path, serialize=fake.serialize, evaluate=fake.evaluate)
+    results = cache.get_info_many(window_stats(windows))
+    assert fake.calls[1] == [window_start.strftime('%Y-%m-%d')]
+    assert (cache.hits, cache.misses) == (4, 1)
+    assert results[window_start.strftime('%Y-%m-%d')] == {'ndvi02_area': 300.0}
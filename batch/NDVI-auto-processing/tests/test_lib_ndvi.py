@@ -0,0 +1,214 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+import numpy as np
+import pytest
+import lib_ndvi
+import local_ndvi
+from definitions import get_millis
+from geometry import raster_grid
+from pixel_cache import PixelCache, ArrayFetcher
+
+
+def square(x, y, size=1.0):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def project(*rings):
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+            for ring in rings
+        ],
+    }
+
+
+def monthly_windows(count):
+    start = datetime(2020, 1, 1)
+    return [(start + timedelta(days=40 * i), [f'scene_{i}']) for i in range(count)]
+
+
+def timeframe(start, end):
+    return {'start_date': start, 'end_date': end}
+
+
+def test_select_local_endpoints_in_the_timeframe():
+    windows = monthly_windows(10)
+    start, end = lib_ndvi.SelectLocalEndpoints(windows, timeframe(windows[2][0], windows[6][0]))
+    assert start == windows[2]
+    assert end == windows[5]
+
+
+def test_select_local_endpoints_falls_back_to_the_last_two_windows():
+    windows = monthly_windows(10)
+    # only one window starts in the timeframe
+    endpoints = lib_ndvi.SelectLocalEndpoints(windows, timeframe(windows[9][0], windows[9][0] + timedelta(days=14)))
+    assert endpoints == (windows[8], windows[9])
+
+
+def test_select_local_endpoints_needs_two_windows():
+    windows = monthly_windows(1)
+    with pytest.raises(ValueError):
+        lib_ndvi.SelectLocalEndpoints(windows, timeframe(windows[0][0], windows[0][0] + timedelta(days=365)))
+
+
+def test_group_overlapping_projects():
+    projects = [
+        project(square(0, 0)),
+        # overlaps the first one
+        project(square(0.5, 0.5)),
+        # far away
+        project(square(10, 10)),
+        # overlaps the second one only, so it joins the group through it
+        project(square(1.2, 1.2)),
+        # inside the far one, as its second feature
+        project(square(20, 20), square(10.2, 10.2, 0.5)),
+    ]
+    assert sorted(lib_ndvi.GroupOverlappingProjects(projects)) == [[0, 1, 3], [2, 4]]
+
+
+def test_group_overlapping_projects_intersects_the_geometries():
+    # the bounding boxes of the two triangles overlap, the triangles themselves do not
+    lower = project([[0, 0], [1, 0], [0, 1], [0, 0]])
+    upper = project([[1, 1], [0.1, 1], [1, 0.1], [1, 1]])
+    assert sorted(lib_ndvi.GroupOverlappingProjects([lower, upper])) == [[0], [1]]
+
+
+def test_batch_sums_add_the_rows_of_a_feature():
+    rows = [
+        [0, 10.0, 100.0, 20.0, 100.0, 1.0],
+        [1, 5.0, 50.0, 5.0, 50.0, 0.0],
+        # a second geometry or tile of feature 0, one without pixels sums to None
+        [0, 1.0, 10.0, None, None, 2.0],
+    ]
+    assert lib_ndvi._BatchSums(rows) == {
+        0: {'vegetation_start': 11.0, 'project_area': 110.0, 'vegetation_end': 20.0, 'project_area_end': 100.0, 'vegetation_gain': 3.0},
+        1: {'vegetation_start': 5.0, 'project_area': 50.0, 'vegetation_end': 5.0, 'project_area_end': 50.0, 'vegetation_gain': 0.0},
+    }
+
+
+class TileExecutor:
+    # evaluates every tile request to the same result, the tiles in fail fail that many times first
+    def __init__(self, result, fail=None):
+        self.result = result
+        self.fail = dict(fail or {})
+        self.evaluated = []
+
+    def evaluate_many(self, requests, return_exceptions=False):
+        self.evaluated.append(sorted(requests.keys()))
+        results = {}
+        for index in requests.keys():
+            if self.fail.get(index):
+                self.fail[index] -= 1
+                results[index] = RuntimeError(f'tile {index} failed')
+            else:
+                results[index] = self.result(index)
+        return results
+
+
+@pytest.fixture
+def stub_ee(monkeypatch):
+    # the tile requests are only built, the stub executor answers them
+    monkeypatch.setattr(lib_ndvi, 'ee', MagicMock())
+    monkeypatch.setattr(lib_ndvi, '_Bounds', lambda geo_data: (0.0, 0.0, 1.0, 1.0))
+
+
+def test_tiled_reduce_region_merges_and_retries_tiles(stub_ee):
+    executor = TileExecutor(
+        lambda index: {'one_year': {'vegetation_start': 1.0, 'project_area': None if index == 0 else 2.0}},
+        fail={2: 1})
+    sums = lib_ndvi.TiledReduceRegion({'one_year': MagicMock()}, {}, executor, tiles_per_side=2)
+    assert sums == {'one_year': {'vegetation_start': 4.0, 'project_area': 6.0}}
+    # only the failed tile is evaluated again
+    assert executor.evaluated == [[0, 1, 2, 3], [2]]
+
+
+def test_tiled_reduce_region_gives_up_after_the_retries(stub_ee):
+    executor = TileExecutor(lambda index: {'one_year': {}}, fail={1: 10})
+    with pytest.raises(RuntimeError):
+        lib_ndvi.TiledReduceRegion({'one_year': MagicMock()}, {}, executor, tiles_per_side=2, max_tile_retries=2)
+    assert len(executor.evaluated) == 3
+
+
+def test_tiled_batch_rows_sum_per_feature(stub_ee):
+    executor = TileExecutor(lambda index: {'one_year': [[0, 1.0, 2.0, 1.0, 2.0, 0.0], [1, 0.0, 1.0, 0.0, 1.0, float(index)]]})
+    rows = lib_ndvi.TiledBatchRows({'one_year': MagicMock()}, {}, MagicMock(), executor, tiles_per_side=2)
+    assert len(rows['one_year']) == 8
+    sums = lib_ndvi._BatchSums(rows['one_year'])
+    assert sums[0] == {'vegetation_start': 4.0, 'project_area': 8.0, 'vegetation_end': 4.0, 'project_area_end': 8.0, 'vegetation_gain': 0.0}
+    assert sums[1]['project_area'] == 4.0
+    assert sums[1]['vegetation_gain'] == 0.0 + 1.0 + 2.0 + 3.0
+
+
+def test_estimate_stats():
+    stats = {
+        # stratum, thres_start, thres_end
+        'samples': [[0, 1, 1], [0, 0, 1], [0, 0, 0], [0, 1, 0], [1, 1, 1], [1, 1, 1]],
+        # stratum 2 got no sample and takes the proportions of the whole sample
+        'strata_area': [{'stratum': 0, 'sum': 400.0}, {'stratum': 1, 'sum': 100.0}, {'stratum': 2, 'sum': 60.0}],
+    }
+    estimates, confidence_intervals = lib_ndvi._EstimateStats(stats)
+    assert estimates['project_area'] == 560.0
+    assert estimates['vegetation_start'] == pytest.approx(400 * 0.5 + 100 * 1 + 60 * 4 / 6)
+    assert estimates['vegetation_end'] == pytest.approx(400 * 0.5 + 100 * 1 + 60 * 4 / 6)
+    assert estimates['vegetation_gain'] == round(400 * 0.25 + 60 * 1 / 6)
+    assert 'vegetation_loss' not in estimates
+    # stratum 1 adds no variance, its samples all agree
+    low, high = confidence_intervals['vegetation_start']
+    margin = 1.96 * (400 ** 2 * 0.5 * 0.5 / 3 + 60 ** 2 * (4 / 6) * (2 / 6) / 5) ** 0.5
+    assert (low, high) == pytest.approx((estimates['vegetation_start'] - margin, estimates['vegetation_start'] + margin))
+    # the loss interval is negated like the loss the report derives
+    low, high = confidence_intervals['vegetation_loss']
+    assert (low + high) / 2 == pytest.approx(-(400 * 0.25 + 60 * 1 / 6))
+
+
+def test_estimate_stats_without_samples():
+    assert lib_ndvi._EstimateStats({'samples': [], 'strata_area': [{'stratum': 0, 'sum': 100.0}]}) is None
+
+
+def local_mosaic(seed, shape):
+    rng = np.random.default_rng(seed)
+    return {band: rng.integers(0, 5000, shape, dtype=np.uint16) for band in ('B4', 'B8')}
+
+
+def test_local_reports_keep_the_endpoints_in_the_raster_cube(tmp_path, monkeypatch):
+    # the maps are still built from earth engine images, the statistics come from the cube and the threshold history
+    # under the working directory
+    monkeypatch.setattr(lib_ndvi, 'ee', MagicMock())
+    monkeypatch.chdir(tmp_path)
+    geo_data = project(square(46.60, 24.80, 0.005))
+    _, shape = raster_grid(geo_data)
+    start, end = datetime(2020, 1, 1), datetime(2020, 2, 10)
+    mosaics = {get_millis(start): local_mosaic(0, shape), get_millis(end): local_mosaic(1, shape)}
+    endpoint_windows = [(start, ['a']), (end, ['b'])]
+
+    def local_reports(scene_ids_end=('b',)):
+        fetcher = ArrayFetcher(mosaics)
+        pixel_cache = PixelCache(tmp_path / 'pixel_cache', fetcher=fetcher)
+        windows = {'one_year': [(start, ['a']), (end, list(scene_ids_end))]}
+        reports = lib_ndvi.GenerateLocalReports(
+            {'one_year': (MagicMock(), MagicMock())}, windows, geo_data, {'one_year': 'map.png'}, 'trial', pixel_cache)
+        return reports['one_year']['stats'], fetcher.requests
+
+    stats, requests = local_reports()
+    assert requests == 2
+    assert stats['end_date_satellite'] == '10.02.2020'
+    transform, _ = raster_grid(geo_data)
+    aoi_mask = lib_ndvi.rasterize(geo_data, transform, shape)
+
+    def bands(mosaic):
+        return tuple(mosaic[band].astype(np.float32) for band in ('B4', 'B8'))
+
+    expected = local_ndvi.comparison_stats(bands(mosaics[get_millis(start)]), bands(mosaics[get_millis(end)]), aoi_mask)
+    assert stats == {**stats, **lib_ndvi._LocalStats('one_year', endpoint_windows, expected)}
+
+    # a new pixel cache, the history still holds both endpoints
+    cached_stats, requests = local_reports()
+    assert requests == 0
+    assert cached_stats == stats
+
+    # a late scene in the end window is downloaded again
+    mosaics[get_millis(end)] = local_mosaic(2, shape)
+    late_stats, requests = local_reports(('b', 'late'))
+    assert requests == 1
+    assert late_stats['vegetation_end'] != stats['vegetation_end']
@@ -0,0 +1,64 @@
+import numpy as np
+import local_ndvi
+
+
+def test_ndvi_known_values():
+    b4 = np.array([100, 0, 300, 0, 200])
+    b8 = np.array([300, 0, 100, 500, 200])
+    values = local_ndvi.ndvi(b4, b8)
+    assert values.dtype == np.float32
+    np.testing.assert_allclose(values, [0.5, 0.0, -0.5, 1.0, 0.0])
+
+
+def test_ndvi_masks_negative_and_nan_inputs():
+    values = local_ndvi.ndvi([-1, 100, np.nan], [100, -1, 100])
+    assert np.isnan(values).all()
+
+
+def test_threshold_edges():
+    # 0.2 is not exact in float32, the stored value lies just above the threshold like in earth engine
+    values = np.array([0.2, np.nextafter(np.float32(0.2), np.float32(0)), 1.0, -1.0, np.nan], dtype=np.float32)
+    thres, valid = local_ndvi.threshold(values)
+    assert thres.tolist() == [True, False, True, False, False]
+    assert valid.tolist() == [True, True, True, True, False]
+
+
+def _bands(ndvi_values):
+    # b4/b8 pairs with the given NDVI, NaN for a masked pixel
+    ndvi_values = np.asarray(ndvi_values, dtype=np.float64)
+    b8 = np.full(ndvi_values.shape, 1000.0)
+    b4 = b8 * (1 - ndvi_values) / (1 + ndvi_values)
+    return b4, b8
+
+
+def test_comparison_stats_counts_gain_and_loss():
+    start = _bands([[0.5, 0.5, 0.1, 0.1], [0.5, np.nan, 0.1, 0.5]])
+    end = _bands([[0.5, 0.1, 0.5, 0.1], [np.nan, 0.5, 0.5, 0.5]])
+    aoi_mask = np.array([[True, True, True, True], [True, True, True, False]])
+    stats = local_ndvi.comparison_stats(start, end, aoi_mask, pixel_area=100)
+    # the masked pixel of either endpoint and the pixel outside the AOI drop out of the change
+    assert stats['vegetation_gain'] == 2
+    assert stats['vegetation_loss'] == 1
+    assert stats['vegetation_start'] == 3 * 100
+    assert stats['project_area'] == 6 * 100
+    assert stats['vegetation_end'] == 4 * 100
+    assert stats['project_area_end'] == 6 * 100
+
+
+def test_chunks_sum_to_the_full_array():
+    rng = np.random.default_rng(0)
+    start = _bands(rng.uniform(-0.5, 0.9, (37, 23)))
+    end = _bands(rng.uniform(-0.5, 0.9, (37, 23)))
+    aoi_mask = rng.random((37, 23)) < 0.8
+    assert (local_ndvi.comparison_stats(start, end, aoi_mask, chunk_rows=5)
+        == local_ndvi.comparison_stats(start, end, aoi_mask, chunk_rows=100))
+    assert (local_ndvi.mosaic_stats(*start, aoi_mask, chunk_rows=5)
+        == local_ndvi.mosaic_stats(*start, aoi_mask, chunk_rows=100))
+
+
+def test_growth_decline():
+    start = _bands([0.5, 0.1, 0.5, np.nan])
+    end = _bands([0.1, 0.5, 0.5, 0.5])
+    change = local_ndvi.growth_decline(start, end)
+    assert change[:2].tolist() == [-1, 1]
+    assert np.isnan(change[2:]).all()
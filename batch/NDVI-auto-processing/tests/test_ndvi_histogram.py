@@ -0,0 +1,66 @@
+import json
+import pytest
+from ndvi_histogram import (
+    histogram_from_groups, histogram_groups, histogram_area, no_ndvi_bin, threshold_bin, vegetation_area,
+    threshold_stats, history_threshold_stats
+)
+
+GROUPS = [
+    {'bin': no_ndvi_bin(), 'sum': 50.0},
+    {'bin': -3, 'sum': 100.0},
+    {'bin': 0, 'sum': 0},
+    {'bin': 19, 'sum': 200.0},
+    {'bin': 20, 'sum': 300.0},
+    {'bin': 99, 'sum': 400.0},
+]
+
+
+def test_only_bins_with_area_are_kept():
+    histogram = histogram_from_groups(GROUPS)
+    assert list(histogram.keys()) == [no_ndvi_bin(), -3, 19, 20, 99]
+    assert histogram_from_groups(histogram_groups(histogram)) == histogram
+
+
+def test_pixels_without_ndvi_count_in_the_area_only():
+    histogram = histogram_from_groups(GROUPS)
+    assert histogram_area(histogram) == 1050.0
+    assert vegetation_area(histogram, -1) == 1000.0
+    assert vegetation_area(histogram, 0.2) == 700.0
+    assert vegetation_area(histogram, 1) == 0
+
+
+def test_json_round_trip():
+    histogram = histogram_from_groups(GROUPS)
+    stored = json.loads(json.dumps(histogram))
+    assert vegetation_area(stored, 0.2) == vegetation_area(histogram, 0.2)
+    assert threshold_stats(stored, stored) == threshold_stats(histogram, histogram)
+
+
+def test_threshold_must_be_a_bin_edge():
+    assert threshold_bin(0.2) == 20
+    with pytest.raises(ValueError):
+        threshold_bin(0.205)
+    with pytest.raises(ValueError):
+        threshold_bin(1.5)
+
+
+def test_history_threshold_stats(tmp_path):
+    start = histogram_from_groups(GROUPS)
+    end = histogram_from_groups([{'bin': 30, 'sum': 1050.0}])
+    history = {
+        '01.01.2024': {
+            'one_year': {'ndvi_histogram_start': start, 'ndvi_histogram_end': end},
+            'two_weeks': {'vegetation_start': 1.0},
+        }
+    }
+    json_file_name = tmp_path / 'project.json'
+    json_file_name.write_text(json.dumps(history), encoding='utf-8')
+    stats = history_threshold_stats(json_file_name, thresholds=[0.2])
+    assert list(stats['01.01.2024'].keys()) == ['one_year']
+    assert stats['01.01.2024']['one_year']['0.2'] == {
+        'vegetation_start': 700.0,
+        'vegetation_end': 1050.0,
+        'vegetation_share_start': 700.0 / 1050.0 * 100,
+        'vegetation_share_end': 100.0,
+        'area_change': 350.0,
+    }
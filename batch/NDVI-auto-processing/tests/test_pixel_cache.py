@@ -0,0 +1,117 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from definitions import get_millis
+from geometry import raster_grid
+from pixel_cache import PixelCache, ArrayFetcher
+
+WINDOW = datetime(2020, 1, 1)
+GEO_DATA = {
+    "type": "FeatureCollection",
+    "features": [{
+        "type": "Feature",
+        "properties": {},
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[46.60, 24.80], [46.61, 24.80], [46.61, 24.81], [46.60, 24.81], [46.60, 24.80]]],
+        },
+    }],
+}
+
+
+def mosaic(seed):
+    _, shape = raster_grid(GEO_DATA)
+    rng = np.random.default_rng(seed)
+    return {band: rng.integers(0, 5000, shape, dtype=np.uint16) for band in ('B4', 'B8')}
+
+
+def new_cache(path, mosaics, **kwargs):
+    fetcher = ArrayFetcher({get_millis(window_start): bands for window_start, bands in mosaics.items()})
+    # small tiles so the AOI spans several of them
+    return PixelCache(path, fetcher=fetcher, tile_shape=(32, 32), max_workers=2, **kwargs), fetcher
+
+
+def test_miss_then_hit(tmp_path):
+    bands = mosaic(0)
+    cache, fetcher = new_cache(tmp_path, {WINDOW: bands})
+    first, transform = cache.read(WINDOW, ['a', 'b'], GEO_DATA)
+    requests = fetcher.requests
+    assert requests > 1
+    np.testing.assert_array_equal(first['B8'], bands['B8'].astype(np.float32))
+    assert transform == raster_grid(GEO_DATA)[0]
+
+    # a new instance reads the complete entry from disk
+    cache, fetcher = new_cache(tmp_path, {WINDOW: bands})
+    second, _ = cache.read(WINDOW, ['b', 'a'], GEO_DATA)
+    assert fetcher.requests == 0
+    np.testing.assert_array_equal(second['B4'], first['B4'])
+
+
+def test_changed_scene_ids_miss(tmp_path):
+    cache, fetcher = new_cache(tmp_path, {WINDOW: mosaic(0)})
+    cache.read(WINDOW, ['a'], GEO_DATA)
+    requests = fetcher.requests
+    # a late scene changes the mosaic, so its pixels are fetched again
+    cache.fetcher.mosaics[get_millis(WINDOW)] = mosaic(1)
+    changed, _ = cache.read(WINDOW, ['a', 'late'], GEO_DATA)
+    assert fetcher.requests == 2 * requests
+    np.testing.assert_array_equal(changed['B4'], mosaic(1)['B4'].astype(np.float32))
+
+
+def test_nodata_reads_as_nan(tmp_path):
+    bands = mosaic(0)
+    bands['B4'][0, :5] = 65535
+    cache, _ = new_cache(tmp_path, {WINDOW: bands})
+    band_arrays, _ = cache.read(WINDOW, ['a'], GEO_DATA)
+    assert np.isnan(band_arrays['B4'][0, :5]).all()
+    assert not np.isnan(band_arrays['B8'][0, :5]).any()
+
+
+class FailingFetcher(ArrayFetcher):
+    # fails on the first request of one tile
+    def __init__(self, mosaics, failing_rows_start):
+        super().__init__(mosaics)
+        self.failing_rows_start = failing_rows_start
+        self.failed = False
+
+    def __call__(self, window_start, scene_ids, geo_data, bands, transform, rows, columns, nodata):
+        if rows.start == self.failing_rows_start and not self.failed:
+            self.failed = True
+            raise RuntimeError('computePixels failed')
+        return super().__call__(window_start, scene_ids, geo_data, bands, transform, rows, columns, nodata)
+
+
+def test_interrupted_fetch_resumes(tmp_path):
+    bands = mosaic(0)
+    fetcher = FailingFetcher({get_millis(WINDOW): bands}, failing_rows_start=32)
+    cache = PixelCache(tmp_path, fetcher=fetcher, tile_shape=(32, 32), max_workers=1)
+    with pytest.raises(RuntimeError):
+        cache.read(WINDOW, ['a'], GEO_DATA)
+    first_attempt = fetcher.requests
+
+    # the tiles written by the first attempt stay on disk, only the failed one is requested again
+    fetcher.requests = 0
+    band_arrays, _ = cache.read(WINDOW, ['a'], GEO_DATA)
+    tiles = len(cache._tiles(raster_grid(GEO_DATA)[1]))
+    assert first_attempt == tiles - 1
+    assert fetcher.requests == 1
+    np.testing.assert_array_equal(band_arrays['B4'], bands['B4'].astype(np.float32))
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    windows = [datetime(2020, 1, 1), datetime(2020, 2, 10), datetime(2020, 3, 21)]
+    mosaics = {window_start: mosaic(i) for i, window_start in enumerate(windows)}
+    entry_bytes = 2 * mosaic(0)['B4'].nbytes
+    cache, _ = new_cache(tmp_path, mosaics, max_bytes=2.5 * entry_bytes)
+    for window_start in windows:
+        cache.read(window_start, [str(window_start)], GEO_DATA)
+    entries = [entry for entry in tmp_path.iterdir() if (entry / 'meta.json').exists()]
+    assert len(entries) == 2
+
+    # the oldest window is fetched again, the other two are read from disk
+    cache.fetcher.requests = 0
+    cache.read(windows[2], [str(windows[2])], GEO_DATA)
+    cache.read(windows[1], [str(windows[1])], GEO_DATA)
+    assert cache.fetcher.requests == 0
+    cache.read(windows[0], [str(windows[0])], GEO_DATA)
+    assert cache.fetcher.requests > 0
@@ -0,0 +1,102 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from raster_cube import RasterCube
+
+SHAPE = (45, 70)
+TRANSFORM = (46.6, 24.8, 1e-4, 1e-4)
+
+
+def band_arrays(seed):
+    rng = np.random.default_rng(seed)
+    arrays = {band: rng.integers(0, 5000, SHAPE, dtype=np.uint16) for band in ('B4', 'B8')}
+    # a masked corner
+    arrays['B4'][:3, :4] = 65535
+    arrays['B8'][:3, :4] = 65535
+    return arrays
+
+
+def new_cube(path):
+    # chunks that do not divide the shape, so the edge chunks are partial
+    return RasterCube(path, shape=SHAPE, transform=TRANSFORM, chunk_shape=(16, 32))
+
+
+def test_append_and_reopen(tmp_path):
+    first, second = datetime(2020, 1, 1), datetime(2020, 2, 10)
+    cube = new_cube(tmp_path)
+    cube.append(first, band_arrays(0))
+    cube.append(second, band_arrays(1))
+
+    reopened = RasterCube(tmp_path)
+    assert reopened.windows() == [first, second]
+    assert reopened.shape == SHAPE
+    expected = band_arrays(1)['B8'].astype(np.float32)
+    expected[expected == 65535] = np.nan
+    np.testing.assert_array_equal(reopened.read(second, 'B8'), expected)
+
+
+def test_read_window_across_chunks(tmp_path):
+    window = datetime(2020, 1, 1)
+    cube = new_cube(tmp_path)
+    arrays = band_arrays(2)
+    cube.append(window, arrays)
+    rows, columns = slice(10, 40), slice(30, 67)
+    np.testing.assert_array_equal(
+        cube.read(window, 'B4', rows, columns), arrays['B4'][rows, columns].astype(np.float32))
+    assert np.isnan(cube.read(window, 'B4', slice(0, 3), slice(0, 4))).all()
+
+
+def test_appending_keeps_existing_data(tmp_path):
+    cube = new_cube(tmp_path)
+    cube.append(datetime(2020, 1, 1), band_arrays(0))
+    data = (tmp_path / 'chunks.bin').read_bytes()
+    cube.append(datetime(2020, 2, 10), band_arrays(1))
+    assert (tmp_path / 'chunks.bin').read_bytes()[:len(data)] == data
+
+
+def test_duplicate_and_missing_windows(tmp_path):
+    window = datetime(2020, 1, 1)
+    cube = new_cube(tmp_path)
+    cube.append(window, band_arrays(0))
+    with pytest.raises(ValueError):
+        cube.append(window, band_arrays(1))
+    with pytest.raises(KeyError):
+        cube.read(datetime(2020, 2, 10), 'B4')
+    with pytest.raises(ValueError):
+        cube.append(datetime(2020, 2, 10), {band: array[:-1] for band, array in band_arrays(1).items()})
+    # the rejected windows leave the cube as it was
+    assert RasterCube(tmp_path).windows() == [window]
+
+
+def test_new_cube_needs_shape_and_transform(tmp_path):
+    with pytest.raises(ValueError):
+        RasterCube(tmp_path)
+
+
+def test_late_scene_replaces_a_window(tmp_path):
+    window = datetime(2020, 1, 1)
+    cube = new_cube(tmp_path)
+    cube.append(window, band_arrays(0), scene_ids=['b', 'a'])
+    assert cube.has(window, ['a', 'b'])
+    assert not cube.has(window, ['a', 'b', 'late'])
+    with pytest.raises(ValueError):
+        cube.append(window, band_arrays(1), scene_ids=['a', 'b'])
+
+    cube.append(window, band_arrays(1), scene_ids=['a', 'b', 'late'])
+    reopened = RasterCube(tmp_path)
+    assert reopened.windows() == [window]
+    assert reopened.has(window, ['late', 'a', 'b'])
+    expected = band_arrays(1)['B4'].astype(np.float32)
+    expected[expected == 65535] = np.nan
+    np.testing.assert_array_equal(reopened.read(window, 'B4'), expected)
+
+
+def test_append_float_bands_with_nan(tmp_path):
+    # the float32 arrays of PixelCache.read, NaN where the mosaic is masked
+    window = datetime(2020, 1, 1)
+    cube = new_cube(tmp_path)
+    arrays = {band: array.astype(np.float32) for band, array in band_arrays(0).items()}
+    for array in arrays.values():
+        array[array == 65535] = np.nan
+    cube.append(window, arrays)
+    np.testing.assert_array_equal(cube.read(window, 'B8'), arrays['B8'])
@@ -0,0 +1,25 @@
+from datetime import datetime
+from report_cache import ReportCache
+
+ENDPOINTS = ((datetime(2020, 1, 1), ['a', 'b']), (datetime(2021, 1, 1), ['c']))
+
+
+def test_every_mode_has_its_own_key(tmp_path):
+    cache = ReportCache(tmp_path)
+    keys = [
+        cache.key('aoi', 'one_year', ENDPOINTS),
+        cache.key('aoi', 'one_year', ENDPOINTS, histogram=True),
+        cache.key('aoi', 'one_year', ENDPOINTS, batched=True),
+        cache.key('aoi', 'one_year', ENDPOINTS, local_stats=True),
+        cache.key('aoi', 'one_year', ENDPOINTS, approximate=True),
+        cache.key('aoi', 'one_year', ENDPOINTS, tiles_per_side=4),
+        cache.key('aoi', 'one_year', ENDPOINTS, tiles_per_side=2),
+        cache.key('aoi', 'one_year', ENDPOINTS, batched=True, tiles_per_side=4),
+    ]
+    assert len(set(keys)) == len(keys)
+
+
+def test_scene_order_does_not_change_the_key(tmp_path):
+    cache = ReportCache(tmp_path)
+    reordered = ((ENDPOINTS[0][0], ['b', 'a']), ENDPOINTS[1])
+    assert cache.key('aoi', 'one_year', ENDPOINTS, tiles_per_side=4) == cache.key('aoi', 'one_year', reordered, tiles_per_side=4)
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from unittest.mock import MagicMock
+import pytest
+import scene_catalog
+from definitions import get_millis, get_window_starts
+from scene_catalog import SceneCatalog
+
+BBOX = [[46.0, 24.0], [47.0, 24.0], [47.0, 25.0], [46.0, 25.0], [46.0, 24.0]]
+
+
+def scene(scene_id, acquired, cloudy_pixel_percentage=0.0):
+    # a row like the reduceColumns list of update()
+    return [scene_id, get_millis(acquired), cloudy_pixel_percentage, '38RPN', BBOX, [BBOX]]
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    # the query is only built, the rows come from the evaluate of the test
+    monkeypatch.setattr(scene_catalog, 'ee', MagicMock())
+    catalog = SceneCatalog(str(tmp_path / 'scenes.sqlite'))
+    yield catalog
+    catalog.close()
+
+
+def test_non_empty_windows_skip_empty_and_cloudy_windows(catalog):
+    first, second, third = get_window_starts()[:3]
+    catalog.update(MagicMock(), evaluate=lambda rows: [
+        scene('a', first + timedelta(days=1)),
+        scene('b', first + timedelta(days=5)),
+        # over the cloud threshold, its window has no usable scene
+        scene('c', second + timedelta(days=1), cloudy_pixel_percentage=20.0),
+        scene('d', third + timedelta(days=2)),
+    ])
+    assert catalog.non_empty_windows() == [(first, ['a', 'b']), (third, ['d'])]
+    # a looser threshold is indexed separately
+    assert catalog.non_empty_windows(max_cloud=50) == [(first, ['a', 'b']), (second, ['c']), (third, ['d'])]
+
+
+def test_non_empty_windows_of_some_scenes(catalog):
+    first, second = get_window_starts()[:2]
+    catalog.update(MagicMock(), evaluate=lambda rows: [
+        scene('a', first + timedelta(days=1)),
+        scene('b', first + timedelta(days=5)),
+        scene('c', second + timedelta(days=1)),
+    ])
+    assert catalog.non_empty_windows(scene_ids={'b'}) == [(first, ['b'])]
+
+
+def test_late_scene_indexes_its_window_again(catalog):
+    first, second = get_window_starts()[:2]
+    catalog.update(MagicMock(), evaluate=lambda rows: [scene('b', first + timedelta(days=5))])
+    assert catalog.non_empty_windows() == [(first, ['b'])]
+
+    # an older granule of the first window arrives late
+    catalog.update(MagicMock(), evaluate=lambda rows: [
+        scene('a', first + timedelta(days=1)),
+        scene('b', first + timedelta(days=5)),
+    ])
+    assert catalog.non_empty_windows() == [(first, ['a', 'b'])]
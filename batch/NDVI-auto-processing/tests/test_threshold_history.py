@@ -0,0 +1,81 @@
+from datetime import datetime
+import numpy as np
+import pytest
+import local_ndvi
+import threshold_history
+from threshold_history import ThresholdHistory, pack, unpack, popcount, run_length_encode, run_length_decode
+
+# bit counts around the byte and word boundaries
+COUNTS = [0, 1, 7, 9, 63, 64, 65, 130, 1001]
+
+
+@pytest.mark.parametrize('count', COUNTS)
+def test_pack_round_trip(count):
+    bits = np.random.default_rng(count).random(count) < 0.5
+    words = pack(bits)
+    assert words.dtype == np.uint64
+    assert len(words) == -(-count // 64)
+    np.testing.assert_array_equal(unpack(words, count), bits)
+    # the padding bits are zero
+    assert popcount(pack(np.ones(count, dtype=bool))) == count
+
+
+@pytest.mark.parametrize('count', COUNTS)
+def test_run_length_round_trip(count):
+    bits = np.random.default_rng(count).random(count) < 0.3
+    np.testing.assert_array_equal(run_length_decode(run_length_encode(bits)), bits)
+    for constant in (np.zeros(count, dtype=bool), np.ones(count, dtype=bool)):
+        np.testing.assert_array_equal(run_length_decode(run_length_encode(constant)), constant)
+
+
+def test_popcount_without_bitwise_count(monkeypatch):
+    words = pack(np.random.default_rng(0).random(1001) < 0.5)
+    expected = popcount(words)
+    monkeypatch.delattr(threshold_history.np, 'bitwise_count', raising=False)
+    assert popcount(words) == expected
+
+
+def band_arrays(seed, shape=(21, 13)):
+    rng = np.random.default_rng(seed)
+    b4 = rng.uniform(100, 3000, shape)
+    b8 = rng.uniform(100, 3000, shape)
+    # masked pixels
+    b4[rng.random(shape) < 0.1] = np.nan
+    return b4, b8
+
+
+@pytest.mark.parametrize('rle', [False, True])
+def test_compare_matches_local_ndvi(tmp_path, rle):
+    first, second = datetime(2020, 1, 1), datetime(2020, 2, 10)
+    start, end = band_arrays(1), band_arrays(2)
+    aoi_mask = np.random.default_rng(3).random(start[0].shape) < 0.8
+    history = ThresholdHistory(tmp_path)
+    history.put_bands(first, *start, aoi_mask, rle=rle)
+    history.put_bands(second, *end, aoi_mask, rle=rle)
+
+    # a new instance reads the windows from disk
+    reopened = ThresholdHistory(tmp_path)
+    assert reopened.windows() == [first, second]
+    stats = reopened.compare(first, second)
+    expected = local_ndvi.comparison_stats(start, end, aoi_mask)
+    assert stats['net_change'] == expected['vegetation_gain'] - expected['vegetation_loss']
+    del stats['net_change']
+    assert stats == pytest.approx(expected)
+
+
+def test_late_scene_replaces_a_window(tmp_path):
+    window = datetime(2020, 1, 1)
+    start, end = band_arrays(1), band_arrays(2)
+    aoi_mask = np.ones(start[0].shape, dtype=bool)
+    history = ThresholdHistory(tmp_path)
+    history.put_bands(window, *start, aoi_mask, scene_ids=['b', 'a'])
+    assert history.has(window, ['a', 'b'])
+    assert not history.has(window, ['a', 'b', 'late'])
+    assert not history.has(datetime(2020, 2, 10))
+
+    history.put_bands(window, *end, aoi_mask, scene_ids=['a', 'b', 'late'])
+    reopened = ThresholdHistory(tmp_path)
+    assert reopened.windows() == [window]
+    assert reopened.has(window, ['late', 'a', 'b'])
+    thres, _ = local_ndvi.threshold(local_ndvi.ndvi(*end))
+    assert reopened.compare(window, window)['vegetation_start'] == thres.sum() * 100
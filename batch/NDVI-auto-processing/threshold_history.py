@@ -0,0 +1,133 @@
+# -*- coding: UTF-8 -*-
+# bit-packed history of the thres band per AOI and window, comparisons are popcounts over packed words
+# GenerateLocalReports writes the endpoints of every AOI here and answers its comparisons from them
+import json
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from definitions import *
+import local_ndvi
+
+# one history per AOI under this folder, named by stats_store.aoi_hash
+threshold_history_path = 'threshold_history'
+
+# set bits per byte value, for numpy versions without bitwise_count
+_popcount_table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(words).sum(dtype=np.uint64))
+    return int(_popcount_table[words.view(np.uint8)].sum(dtype=np.uint64))
+
+
+def pack(bits):
+    # flat boolean array to uint64 words, the padding bits are zero so they drop out of every AND
+    packed = np.packbits(np.asarray(bits, dtype=bool).ravel())
+    padded = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+
+def unpack(words, count):
+    # the first count bits of pack
+    return np.unpackbits(np.asarray(words, dtype=np.uint64).view(np.uint8))[:count].astype(bool)
+
+
+def run_length_encode(bits):
+    # lengths of the alternating runs, starting with a run of False (which can be empty)
+    bits = np.asarray(bits, dtype=bool).ravel()
+    changes = np.flatnonzero(bits[1:] != bits[:-1]) + 1
+    boundaries = np.concatenate([[0], changes, [len(bits)]])
+    lengths = np.diff(boundaries).astype(np.uint32)
+    if len(bits) and bits[0]:
+        lengths = np.concatenate([[0], lengths]).astype(np.uint32)
+    return lengths
+
+
+def run_length_decode(lengths):
+    values = np.arange(len(lengths)) % 2 == 1
+    return np.repeat(values, lengths)
+
+
+class ThresholdHistory:
+    # the bits are the AOI pixels in the order of aoi_mask.ravel(), one thres and one valid bitset per window
+
+    def __init__(self, path, max_cached_windows=8):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.path / 'history.json'
+        self.index = {}
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        # packed words of the recently compared windows, a city-scale AOI is a few MB per window
+        self.cache = OrderedDict()
+        self.max_cached_windows = max_cached_windows
+
+    def windows(self):
+        return [datetime.utcfromtimestamp(int(millis) / 1000) for millis in sorted(self.index.keys(), key=int)]
+
+    def has(self, window_start, scene_ids=None):
+        # whether the window is in the history, with scene_ids only if its mosaic was made of these scenes
+        entry = self.index.get(str(get_millis(window_start)))
+        if entry is None:
+            return False
+        return scene_ids is None or entry.get('scene_ids') == sorted(scene_ids)
+
+    def put(self, window_start, thres, valid, rle=False, scene_ids=None):
+        # thres and valid are boolean arrays over the AOI pixels, e.g. thres[aoi_mask]
+        # a window put again (e.g. after a late scene) replaces the stored bits
+        key = str(get_millis(window_start))
+        file_name = f'window_{key}.npz'
+        if rle:
+            np.savez(self.path / file_name, thres=run_length_encode(thres), valid=run_length_encode(valid))
+        else:
+            np.savez(self.path / file_name, thres=pack(thres), valid=pack(valid))
+        self.index[key] = {'file': file_name, 'encoding': 'rle' if rle else 'packed', 'bits': int(np.size(thres))}
+        if scene_ids is not None:
+            self.index[key]['scene_ids'] = sorted(scene_ids)
+        self.cache.pop(key, None)
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=4)
+        tmp_path.replace(self.index_path)
+
+    def put_bands(self, window_start, b4, b8, aoi_mask, rle=False, scene_ids=None):
+        # thres and mask of add_NDVI from the B4/B8 arrays of a mosaic
+        thres, valid = local_ndvi.threshold(local_ndvi.ndvi(b4, b8))
+        self.put(window_start, thres[aoi_mask], valid[aoi_mask], rle, scene_ids)
+
+    def _words(self, window_start):
+        key = str(get_millis(window_start))
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        entry = self.index[key]
+        with np.load(self.path / entry['file']) as stored:
+            if entry['encoding'] == 'rle':
+                words = (pack(run_length_decode(stored['thres'])), pack(run_length_decode(stored['valid'])))
+            else:
+                words = (stored['thres'], stored['valid'])
+        self.cache[key] = words
+        if len(self.cache) > self.max_cached_windows:
+            self.cache.popitem(last=False)
+        return words
+
+    def compare(self, start_window, end_window, pixel_area=stats_scale ** 2):
+        # the band sums of _ReportStatsImage for two windows, ready for _LocalStats
+        thres_start, valid_start = self._words(start_window)
+        thres_end, valid_end = self._words(end_window)
+        both = valid_start & valid_end
+        changed = (thres_start ^ thres_end) & both
+        vegetation_gain = popcount(changed & thres_end)
+        vegetation_loss = popcount(changed & thres_start)
+        return {
+            'vegetation_start': popcount(thres_start & valid_start) * pixel_area,
+            'project_area': popcount(valid_start) * pixel_area,
+            'vegetation_end': popcount(thres_end & valid_end) * pixel_area,
+            'project_area_end': popcount(valid_end) * pixel_area,
+            'vegetation_gain': vegetation_gain,
+            'vegetation_loss': vegetation_loss,
+            'net_change': vegetation_gain - vegetation_loss,
+        }